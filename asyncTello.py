@@ -0,0 +1,323 @@
+import asyncio
+import inspect
+from typing import List, Callable, Awaitable
+from djitellopySim import Tello, TelloException, get_simulation, LATENCY_MIN, LATENCY_MAX
+import telloCommands
+
+
+async def sleep(seconds, simulation=None):
+    """Coroutine version of `djitellopySim.sleep`, waiting in simulated time."""
+    await (simulation or get_simulation()).clock.sleep_async(seconds)
+
+
+class AsyncTello(Tello):
+    """Tello whose commands are coroutines, so many drones can fly from one
+    asyncio event loop instead of one thread each.
+
+    ```python
+    tello = AsyncTello()
+    await tello.takeoff()
+    await tello.move_forward(100)
+    ```
+    """
+
+    async def connect(self, wait_for_state=True):
+        if wait_for_state:
+            t = self.random.randint(1, 5) / 5
+            await self.simulation.clock.sleep_async(t)
+            Tello.LOGGER.debug(
+                "'.connect()' received first state packet after {} seconds".format(t)
+            )
+
+    async def simLat(self, min=LATENCY_MIN, max=LATENCY_MAX):
+        if self.is_latency == False:
+            return False
+        with self.simulation.profiler.timed("command.latency"):
+            await self.simulation.clock.sleep_async(self._latency(min, max))
+
+    async def takeoff(self):
+        Tello.LOGGER.info("sending takoff command to drone")
+        self._command("takeoff")
+        await self.simLat()
+        motion = self._height_motion(1.5)
+        self.is_flying = True
+        await self._travel(*motion)
+
+    async def land(self):
+        Tello.LOGGER.info("sending land command to drone")
+        self._command("land")
+        self.simulation.set_rc(self.index)
+        await self.simLat()
+        await self._travel(*self._height_motion(1.0))
+        self.is_flying = False
+        if self.swarm is False:
+            self.simulation.quit()
+
+    async def move(self, direction: str, x: int):
+        Tello.LOGGER.info(
+            f"sending move command to drone in direction {direction} by {x}"
+        )
+        if not self.is_flying:
+            raise TelloException("Drone is not flying!")
+
+        self._command(f"{direction} {x}")
+        await self.simLat()
+        await self._travel(*self._move_motion(direction, x))
+
+    async def rotate(self, direction: str, x: int):
+        Tello.LOGGER.info(
+            f"sending rotate command to drone in direction {direction} by {x} degrees"
+        )
+        if not self.is_flying:
+            raise TelloException("Drone is not flying!")
+
+        self._command(f"{direction} {x}")
+        await self.simLat()
+        await self._travel(*self._rotate_motion(direction, x))
+
+    async def go_xyz_speed(self, x, y, z, speed):
+        Tello.LOGGER.info(f"sending go command to drone to {x} {y} {z} at {speed}")
+        if not self.is_flying:
+            raise TelloException("Drone is not flying!")
+
+        self._command(f"go {x} {y} {z} {speed}")
+        await self.simLat()
+        await self._travel(*self._go_motion(x, y, z, speed))
+
+    async def curve_xyz_speed(self, x1, y1, z1, x2, y2, z2, speed):
+        Tello.LOGGER.info(
+            f"sending curve command to drone via {x1} {y1} {z1} to {x2} {y2} {z2} at {speed}"
+        )
+        if not self.is_flying:
+            raise TelloException("Drone is not flying!")
+
+        self._command(f"curve {x1} {y1} {z1} {x2} {y2} {z2} {speed}")
+        await self.simLat()
+        await self._travel_path(self._curve_motions(x1, y1, z1, x2, y2, z2, speed))
+
+    async def set_speed(self, x):
+        Tello.set_speed(self, x)
+
+    async def emergency(self):
+        Tello.emergency(self)
+
+    async def _travel_path(self, motions):
+        with self.simulation.profiler.timed("command.motion"):
+            duration = self._start_motions(motions)
+            await self.simulation.wait_motion_async(self.index, duration)
+
+    async def _travel(self, offset, turn, steps):
+        with self.simulation.profiler.timed("command.motion"):
+            duration = self._start_motion(offset, turn, steps)
+            await self.simulation.wait_motion_async(self.index, duration)
+
+    async def flip(self, direction: str):
+        Tello.flip(self, direction)
+
+    async def flip_left(self):
+        await self.flip("l")
+
+    async def flip_right(self):
+        await self.flip("r")
+
+    async def flip_forward(self):
+        await self.flip("f")
+
+    async def flip_back(self):
+        await self.flip("b")
+
+    async def move_forward(self, x):
+        await self.move("forward", x)
+
+    async def move_backward(self, x):
+        await self.move("back", x)
+
+    async def move_left(self, x):
+        await self.move("left", x)
+
+    async def move_right(self, x):
+        await self.move("right", x)
+
+    async def move_up(self, x):
+        await self.move("up", x)
+
+    async def move_down(self, x):
+        await self.move("down", x)
+
+    async def rotate_clockwise(self, x):
+        await self.rotate("cw", x)
+
+    async def rotate_counter_clockwise(self, x):
+        await self.rotate("ccw", x)
+
+    async def send_rc_control(self, left_right_velocity, forward_backward_velocity,
+                              up_down_velocity, yaw_velocity):
+        Tello.send_rc_control(
+            self, left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity
+        )
+
+    async def send_command_with_return(self, command, timeout=7):
+        try:
+            sdk_command, args = telloCommands.parse(command)
+            response = sdk_command.call(self, *args)
+            if inspect.isawaitable(response):
+                response = await response
+        except (TelloException, ValueError) as e:
+            return "error {}".format(e)
+        return "ok" if response is None else response
+
+    async def send_command_without_return(self, cmd):
+        try:
+            sdk_command, args = telloCommands.parse(cmd)
+        except ValueError as e:
+            Tello.LOGGER.warning("{}: {}".format(cmd, e))
+            return
+        if sdk_command.plan is None:
+            # instant commands never wait, so this returns at once
+            response = await self.send_command_with_return(cmd)
+            if response.startswith("error"):
+                Tello.LOGGER.warning("{}: {}".format(cmd, response))
+        else:
+            Tello.send_command_without_return(self, cmd)
+
+
+class _Barrier:
+    # asyncio.Barrier only exists from Python 3.11
+
+    def __init__(self, parties):
+        self.parties = parties
+        self._count = 0
+        self._event = asyncio.Event()
+
+    async def wait(self):
+        event = self._event
+        self._count += 1
+        if self._count == self.parties:
+            self._count = 0
+            self._event = asyncio.Event()
+            event.set()
+        else:
+            await event.wait()
+
+
+class AsyncTelloSwarm:
+    """Swarm of [AsyncTello][asynctello] instances flown from a single event
+    loop. Every drone runs as a coroutine, so a swarm costs no threads.
+    """
+
+    @staticmethod
+    def fromFile(path: str, simulation=None):
+        """Create AsyncTelloSwarm from file. The file should contain one IP address per line.
+
+        Arguments:
+            path: path to the file
+            simulation: simulation to fly in, the shared one if not given
+        """
+        with open(path, 'r') as fd:
+            ips = fd.readlines()
+
+        return AsyncTelloSwarm.fromIps(ips, simulation)
+
+    @staticmethod
+    def fromIps(ips: list, simulation=None):
+        """Create AsyncTelloSwarm from a list of IP addresses.
+
+        Arguments:
+            ips: list of IP Addresses
+            simulation: simulation to fly in, the shared one if not given
+        """
+        if not ips:
+            raise TelloException("No ips provided")
+
+        tellos = [AsyncTello(ip.strip(), swarm=True, simulation=simulation) for ip in ips]
+        for i, tello in enumerate(tellos):
+            tello._setSwarmPos(i)
+
+        return AsyncTelloSwarm(tellos)
+
+    def __init__(self, tellos: List[AsyncTello]):
+        """Initialize an AsyncTelloSwarm instance
+
+        Arguments:
+            tellos: list of [AsyncTello][asynctello] instances
+        """
+        self.tellos = tellos
+        self.simulation = tellos[0].simulation if tellos else get_simulation()
+        if any(tello.simulation is not self.simulation for tello in tellos):
+            raise TelloException("All drones in a swarm must be in the same simulation")
+        self.barrier = _Barrier(len(tellos))
+        self.simulation.event_loop()
+
+    async def sequential(self, func: Callable[[int, AsyncTello], Awaitable]):
+        """Await `func` for each tello, one after the other.
+
+        ```python
+        await swarm.sequential(lambda i, tello: tello.move_left(i * 30 + 30))
+        ```
+        """
+        for i, tello in enumerate(self.tellos):
+            await func(i, tello)
+
+    async def parallel(self, func: Callable[[int, AsyncTello], Awaitable]):
+        """Await `func` for every tello at once and return their results.
+        The function retrieves the index `i` of the drone and the `tello`
+        itself, and must return an awaitable.
+
+        You can use `await swarm.sync()` for syncing between drones.
+
+        ```python
+        await swarm.parallel(lambda i, tello: tello.move_up(50 + i * 10))
+        ```
+        """
+        clock = self.simulation.clock
+        # all drones join the clock together so none of them races ahead
+        clock.reserve(len(self.tellos))
+
+        async def run(i, tello):
+            with clock.participate(reserved=True):
+                return await func(i, tello)
+
+        return await asyncio.gather(*(run(i, tello) for i, tello in enumerate(self.tellos)))
+
+    async def sync(self):
+        """Wait until every drone in the current `parallel` call has reached
+        `sync`.
+
+        ```python
+        async def doStuff(i, tello):
+            await tello.move_up(50 + i * 10)
+            await swarm.sync()
+
+            if i == 2:
+                await tello.flip_back()
+            # make all other drones wait for one to complete its flip
+            await swarm.sync()
+
+        await swarm.parallel(doStuff)
+        ```
+        """
+        with self.simulation.clock.idle(), self.simulation.profiler.timed("swarm.sync_wait"):
+            await self.barrier.wait()
+
+    async def land(self):
+        await self.parallel(lambda i, tello: tello.land())
+        self.simulation.quit()
+
+    def __getattr__(self, attr):
+        """Call a standard tello coroutine on all tellos at once.
+
+        ```python
+        await swarm.takeoff()
+        await swarm.move_up(50)
+        ```
+        """
+        async def callAll(*args, **kwargs):
+            return await self.parallel(lambda i, tello: getattr(tello, attr)(*args, **kwargs))
+
+        return callAll
+
+    def __iter__(self):
+        return iter(self.tellos)
+
+    def __len__(self):
+        return len(self.tellos)
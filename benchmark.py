@@ -0,0 +1,205 @@
+"""Performance benchmarks for the simulator.
+
+Sweeps the swarm size, trail and grid drawing and the wind and latency flags,
+and writes frame times, swarm dispatch overhead, command completion latency
+and flight recorder memory to a JSON file that can be compared between
+releases:
+
+    python benchmark.py --drones 1 10 100 1000 --output benchmark.json
+
+The simulation runs on the discrete-event clock, so wall times measure the
+simulator's own overhead rather than simulated flight time. Frames are drawn
+through the same code as the simulator window, onto SDL's dummy display
+unless `--window` is given.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import itertools
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+import physicsSim
+from physicsSim import sim, SpriteCache, TrailLayer, DirtyRenderer
+from djitellopySim import Tello, TelloSwarm
+
+PERCENTILES = (50, 90, 99)
+
+
+def summarise(samples):
+    """Mean, max and percentiles of `samples` seconds, in milliseconds."""
+    ms = np.asarray(samples) * 1000
+    summary = {"mean": float(ms.mean()), "max": float(ms.max()), "count": len(ms)}
+    for p, value in zip(PERCENTILES, np.percentile(ms, PERCENTILES)):
+        summary["p{}".format(p)] = float(value)
+    return summary
+
+
+def make_swarm(count):
+    simulation = sim(clock="fast", headless=True)
+    swarm = TelloSwarm.fromIps(["10.0.{}.{}".format(i // 250, i % 250 + 1) for i in range(count)], simulation)
+    return simulation, swarm
+
+
+def bench_dispatch(swarm, repeats):
+    """Time `parallel` calls whose function does nothing."""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        swarm.parallel(lambda i, tello: None)
+        samples.append(time.perf_counter() - start)
+    return summarise(samples)
+
+
+def bench_commands(swarm, wind, latency, repeats):
+    """Time each drone's move and rotate commands, in wall and simulated time."""
+    clock = swarm.simulation.clock
+    wall = []
+    simulated = []
+
+    def fly(i, tello):
+        for command in itertools.islice(itertools.cycle((
+            lambda: tello.move_forward(50), lambda: tello.rotate_clockwise(90),
+        )), repeats):
+            start, sim_start = time.perf_counter(), clock.now()
+            command()
+            wall.append(time.perf_counter() - start)
+            simulated.append(clock.now() - sim_start)
+
+    for tello in swarm:
+        tello.is_windy = wind
+        tello.is_latency = latency
+    swarm.takeoff()
+    swarm.parallel(fly)
+    swarm.parallel(lambda i, tello: tello.land())
+    return {"wall": summarise(wall), "simulated": summarise(simulated)}
+
+
+def bench_recorder(swarm, seconds):
+    """Memory held by every drone's `flightPathTaken` after `seconds` of flight."""
+    simulation = swarm.simulation
+    for tello in swarm:
+        tello.flightPathTaken.clear()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for tello in swarm:
+        tello.is_flying = True
+    simulation.clock.sleep(seconds)
+    grown = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    for tello in swarm:
+        tello.is_flying = False
+    return {
+        "seconds": seconds,
+        "samples": sum(len(tello.flightPathTaken) for tello in swarm),
+        "nbytes": sum(tello.flightPathTaken.nbytes for tello in swarm),
+        "allocated": grown,
+    }
+
+
+def bench_render(simulation, frames, trails, grid, screen):
+    """Time drawing `frames` frames while every drone flies across the screen."""
+    pygame = physicsSim.pygame
+    state = simulation.state
+    n = state.count
+    width, height = screen.get_size()
+
+    # spread the swarm over the screen, all drones moving and turning
+    rng = np.random.default_rng(0)
+    with simulation.lock:
+        state.pos[:n] = rng.uniform((0, 0, 1.2), (width, height, 2.5), (n, 3))
+        state.last_pos[:n] = state.pos[:n]
+        state.flying[:n] = True
+    for i in range(n):
+        simulation.set_motion(i, rng.uniform(-200, 200, 3) * (1, 1, 0), rng.uniform(-360, 360), 10)
+
+    sprites = SpriteCache(pygame.image.load(physicsSim.IMAGE_PATH).convert_alpha())
+    renderer = DirtyRenderer(screen, sprites)
+    layer = TrailLayer((width, height)) if trails else None
+    samples = []
+    for _ in range(frames):
+        simulation.clock.sleep(1 / 60)
+        start = time.perf_counter()
+        rects = renderer.draw(
+            state.pos[:n], state.rot[:n], state.flip[:n], state.scl[:n],
+            state.led[:n], trails=layer, now=simulation.clock.now(), grid=grid,
+        )
+        if rects is None:
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
+        samples.append(time.perf_counter() - start)
+
+    for i in range(n):
+        simulation.set_motion(i)
+    state.flying[:n] = False
+    return summarise(samples)
+
+
+def run(args):
+    if not args.window:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame = physicsSim._load_pygame()
+    pygame.init()
+    screen = pygame.display.set_mode((1000, 1000))
+    Tello.LOGGER.setLevel("WARNING")
+
+    results = []
+    for count in args.drones:
+        simulation, swarm = make_swarm(count)
+        result = {"drones": count}
+        print("{} drones".format(count), file=sys.stderr)
+
+        result["dispatch"] = bench_dispatch(swarm, args.repeats)
+        result["commands"] = [
+            dict(wind=wind, latency=latency, **bench_commands(swarm, wind, latency, args.commands))
+            for wind, latency in itertools.product((False, True), repeat=2)
+        ]
+        result["recorder"] = bench_recorder(swarm, args.flight_seconds)
+        result["render"] = [
+            dict(trails=trails, grid=grid, **bench_render(simulation, args.frames, trails, grid, screen))
+            for trails, grid in itertools.product((False, True), args.grid)
+        ]
+
+        simulation.quit()
+        results.append(result)
+
+    pygame.quit()
+    return {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pygame": pygame.version.ver,
+            "physics_hz": physicsSim.PHYSICS_HZ,
+            "args": vars(args),
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Tello simulator.")
+    parser.add_argument("--drones", type=int, nargs="+", default=[1, 10, 100, 1000],
+                        help="swarm sizes to sweep")
+    parser.add_argument("--grid", type=int, nargs="+", default=[0, 50],
+                        help="GRID settings to sweep, 0 for none")
+    parser.add_argument("--frames", type=int, default=240, help="frames drawn per render setting")
+    parser.add_argument("--repeats", type=int, default=50, help="parallel calls timed per swarm")
+    parser.add_argument("--commands", type=int, default=4, help="commands each drone sends per setting")
+    parser.add_argument("--flight-seconds", type=float, default=60,
+                        help="simulated flight time for the recorder memory check")
+    parser.add_argument("--window", action="store_true", help="draw to a real window")
+    parser.add_argument("--output", default="benchmark.json")
+    args = parser.parse_args()
+
+    report = run(args)
+    with open(args.output, "w") as fd:
+        json.dump(report, fd, indent=2)
+    print("Wrote {}".format(args.output), file=sys.stderr)
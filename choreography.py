@@ -0,0 +1,302 @@
+import heapq
+from collections import namedtuple
+
+from djitellopySim import Tello, TelloException, SLEEP_HOOK, LATENCY_MIN, LATENCY_MAX
+from physicsSim import VirtualClock
+
+Cue = namedtuple("Cue", "t drone command args")
+
+# convenience methods and the basic command they stand for
+ALIASES = {
+    "move_forward": ("move", "forward"),
+    "move_backward": ("move", "back"),
+    "move_left": ("move", "left"),
+    "move_right": ("move", "right"),
+    "move_up": ("move", "up"),
+    "move_down": ("move", "down"),
+    "rotate_clockwise": ("rotate", "cw"),
+    "rotate_counter_clockwise": ("rotate", "ccw"),
+    "flip_left": ("flip", "l"),
+    "flip_right": ("flip", "r"),
+    "flip_forward": ("flip", "f"),
+    "flip_back": ("flip", "b"),
+}
+MOTIONS = ("takeoff", "land", "move", "rotate")
+INSTANT = ("flip", "send_command_without_return", "connect")
+
+
+def normalise(command, args):
+    """`(command, args)` with convenience methods such as `move_up` turned
+    into the basic commands they call."""
+    if command in ALIASES:
+        command, first = ALIASES[command]
+        args = (first,) + tuple(args)
+    if command not in MOTIONS and command not in INSTANT:
+        raise TelloException("{} can't be put on a timeline".format(command))
+    return command, tuple(args)
+
+
+def motion(tello, command, args):
+    """`(offset, turn, steps)` that `command` would fly from `tello`'s current
+    state, or None for commands that do not move the drone. `tello` only needs
+    a `drone` mapping with `pos`, `rot` and `speed`."""
+    match command:
+        case "takeoff":
+            return Tello._height_motion(tello, 1.5)
+        case "land":
+            return Tello._height_motion(tello, 1.0)
+        case "move":
+            return Tello._move_motion(tello, *args)
+        case "rotate":
+            return Tello._rotate_motion(tello, *args)
+    return None
+
+
+def describe(command, args):
+    # the command as the SDK would spell it, for session logs
+    match command:
+        case "move" | "rotate":
+            return "{} {}".format(*args)
+        case "flip":
+            return "flip {}".format(*args)
+    return command
+
+
+class _Plan:
+    # where a drone is expected to be as its cues are worked through
+
+    def __init__(self, tello):
+        self.drone = {
+            "pos": [float(v) for v in tello.drone["pos"]],
+            "rot": tello.drone["rot"],
+            "speed": tello.drone["speed"],
+        }
+        self.flying = tello.is_flying
+
+    def fly(self, command, args):
+        """Move as `command` would and return how long it takes."""
+        if command in ("move", "rotate") and not self.flying:
+            raise TelloException("Drone is not flying!")
+        planned = motion(self, command, args)
+        if planned is None:
+            return 0.0
+        offset, turn, steps = planned
+        pos = self.drone["pos"]
+        for axis in range(3):
+            pos[axis] += offset[axis]
+        self.drone["rot"] += turn
+        if command == "takeoff":
+            self.flying = True
+        elif command == "land":
+            self.flying = False
+        return steps * 0.01
+
+
+class Timeline:
+    """Choreography of a swarm as commands cued at absolute show times, flown
+    by a single scheduler instead of a thread per drone.
+
+    Each cue starts its command at its time without waiting for it to finish,
+    so the drones stay exactly in step however long the show runs. `validate`
+    checks that no drone is cued to move before its last motion has finished.
+
+    ```python
+    timeline = Timeline(swarm)
+    timeline.at(0, range(4), "takeoff")
+    timeline.at(3, [0, 2], "move_up", 50)
+    timeline.at(3, [1, 3], "move_down", 20)
+    timeline.at(6, range(4), "land")
+    timeline.run()
+    ```
+    """
+
+    def __init__(self, swarm, latency=False):
+        """Arguments:
+            swarm: TelloSwarm, or list of Tellos, to fly
+            latency: delay each command by the drones' simulated latency
+        """
+        self.tellos = list(swarm)
+        self.simulation = self.tellos[0].simulation
+        self.latency = latency
+        self.cues = []
+
+    def at(self, t, drones, command, *args):
+        """Cue `command(*args)` for drone index `drones`, or each index in
+        `drones`, at `t` seconds into the show. Returns the timeline, so cues
+        can be chained."""
+        command, args = normalise(command, args)
+        for drone in [drones] if isinstance(drones, int) else drones:
+            if not 0 <= drone < len(self.tellos):
+                raise TelloException("No drone {} in the swarm".format(drone))
+            self.cues.append(Cue(float(t), drone, command, args))
+        return self
+
+    def sorted(self):
+        """The cues in the order they are flown."""
+        return sorted(self.cues, key=lambda cue: cue.t)
+
+    def _delays(self, drone):
+        """Shortest and longest latency drone index `drone` can add to a cue."""
+        tello = self.tellos[drone]
+        if not self.latency or tello.is_latency == False or not self.simulation.latency:
+            return 0.0, 0.0
+        return LATENCY_MIN, LATENCY_MAX
+
+    def plan(self):
+        """Earliest start and latest end time of every cue, predicted from
+        where the drones are now, so that validation holds whatever latency
+        is drawn. Raises TelloException for a cue that the drone can't fly."""
+        plans = [_Plan(tello) for tello in self.tellos]
+        timings = []
+        for cue in self.sorted():
+            try:
+                duration = plans[cue.drone].fly(cue.command, cue.args)
+            except TelloException as e:
+                raise TelloException("Drone {} at {}s: {}".format(cue.drone, cue.t, e))
+            shortest, longest = self._delays(cue.drone)
+            timings.append((cue, cue.t + shortest, cue.t + longest + duration))
+        return timings
+
+    @property
+    def duration(self):
+        """Show time by which the last cued motion has finished."""
+        return max((end for _, _, end in self.plan()), default=0.0)
+
+    def validate(self, max_duration=None):
+        """Check the show before flying it. Raises TelloException listing
+        every drone cued to start a motion while it could still be flying the
+        last one, and the show's length if it is longer than `max_duration`."""
+        problems = []
+        busy = {}
+        end_of_show = 0.0
+        for cue, start, end in self.plan():
+            if cue.command in MOTIONS:
+                previous = busy.get(cue.drone)
+                if previous is not None and start < previous[2] - 1e-9:
+                    problems.append(
+                        "drone {}: {} at {}s starts before {} at {}s ends at {:.2f}s".format(
+                            cue.drone, describe(cue.command, cue.args), cue.t,
+                            describe(previous[0].command, previous[0].args), previous[0].t, previous[2],
+                        )
+                    )
+                busy[cue.drone] = (cue, start, end)
+            end_of_show = max(end_of_show, end)
+
+        if max_duration is not None and end_of_show > max_duration:
+            problems.append("the show lasts {:.2f}s, more than {}s".format(end_of_show, max_duration))
+        if problems:
+            raise TelloException("Invalid timeline:\n" + "\n".join(problems))
+        return end_of_show
+
+    def run(self, skip=False, validate=True):
+        """Fly the show, returning once every drone has finished its last cue.
+
+        Arguments:
+            skip: jump from one cue to the next in virtual time instead of
+                waiting in real time
+            validate: check the show with `validate` first
+        """
+        if validate:
+            self.validate()
+
+        simulation = self.simulation
+        previous = simulation.clock
+        if skip and not previous.event_driven:
+            simulation.clock = VirtualClock()
+        try:
+            self._run(simulation.clock)
+        finally:
+            if simulation.clock is not previous:
+                simulation.clock = previous
+
+    def _run(self, clock):
+        origin = clock.now()
+        # (time, order, drone, command, args), including the latency delays
+        # and the moments landing drones touch down
+        events = []
+        for order, cue in enumerate(self.sorted()):
+            delay = self.tellos[cue.drone]._latency() if self.latency else 0.0
+            heapq.heappush(events, (cue.t + delay, order, cue.drone, cue.command, cue.args))
+        order = len(events)
+
+        while events:
+            t, _, drone, command, args = heapq.heappop(events)
+            wait = origin + t - clock.now()
+            if wait > 0:
+                clock.sleep(wait)
+
+            tello = self.tellos[drone]
+            if command == "_landed":
+                tello.is_flying = False
+            elif command == "connect":
+                pass
+            elif command in MOTIONS:
+                if command == "takeoff":
+                    tello.is_flying = True
+                tello._command(describe(command, args))
+                duration = tello._start_motion(*motion(tello, command, args))
+                if command == "land":
+                    order += 1
+                    heapq.heappush(events, (t + duration, order, drone, "_landed", ()))
+            else:
+                getattr(tello, command)(*args)
+
+        simulation = self.simulation
+        for tello in self.tellos:
+            while simulation.is_moving(tello.index):
+                clock.sleep(simulation.dt)
+
+    @staticmethod
+    def trace(swarm, func, start=0.0, latency=False):
+        """Compile a script written for `swarm.parallel` into a timeline
+        without flying it.
+
+        `func(i, tello)` is called for each drone in turn with a stand-in
+        tello that puts each command on the timeline. `djitellopySim.sleep`,
+        and every command, moves that drone's show time on by as long as it
+        would have taken. Scripts that need `swarm.sync` can't be traced.
+
+        ```python
+        timeline = Timeline.trace(swarm, doDifferent)
+        timeline.run()
+        ```
+        """
+        timeline = Timeline(swarm, latency)
+        for i, tello in enumerate(timeline.tellos):
+            tracer = _Tracer(timeline, i, tello, start)
+            token = SLEEP_HOOK.set(tracer.sleep)
+            try:
+                func(i, tracer)
+            finally:
+                SLEEP_HOOK.reset(token)
+        return timeline
+
+    def __len__(self):
+        return len(self.cues)
+
+
+class _Tracer:
+    # stands in for a Tello while a script is traced
+
+    def __init__(self, timeline, index, tello, start):
+        self._timeline = timeline
+        self._index = index
+        self._plan = _Plan(tello)
+        self._t = start
+        # commands block for the longest latency, so the next one can never
+        # start before this one has finished
+        self._latency = timeline._delays(index)[1]
+
+    def sleep(self, seconds):
+        self._t += seconds
+
+    def __getattr__(self, name):
+        command, _ = normalise(name, ())
+
+        def cue(*args):
+            command, full_args = normalise(name, args)
+            self._timeline.cues.append(Cue(self._t, self._index, command, full_args))
+            if command in MOTIONS:
+                self._t += self._latency + self._plan.fly(command, full_args)
+
+        return cue
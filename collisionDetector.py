@@ -0,0 +1,172 @@
+from collections import deque, namedtuple
+from itertools import product
+
+import numpy as np
+
+# separations in cm below which two flying drones collide or nearly do
+COLLISION_DISTANCE = 20
+NEAR_MISS_DISTANCE = 50
+# most recent events kept in `CollisionDetector.events`
+EVENT_HISTORY = 1000
+
+ProximityEvent = namedtuple("ProximityEvent", "kind t a b distance")
+
+# cell offsets that, with the pairs inside each cell, visit every pair of
+# neighbouring cells exactly once
+_HALF_NEIGHBOURS = [
+    offset for offset in product((-1, 0, 1), repeat=2) if offset > (0, 0)
+]
+
+
+def close_pairs(points, distance):
+    """Index pairs `(a, b)`, `a < b`, of the rows of `points` closer than
+    `distance`, and how far apart they are.
+
+    The points are hashed into a grid of `distance`-sized cells, so only
+    drones in neighbouring cells are ever compared.
+    """
+    n = len(points)
+    if n < 2:
+        return np.empty(0, int), np.empty(0, int), np.empty(0)
+
+    # the swarm is spread out across the screen but only a few metres tall,
+    # so cells span all altitudes and only x and y are hashed
+    flat = points[:, :2]
+    low = flat.min(axis=0)
+    extent = flat.max(axis=0) - low
+    # grow the cells when drones are so spread out the table would be huge
+    size = max(distance, float(np.sqrt(extent[0] * extent[1] / (8 * n))))
+    # a border of empty cells keeps every neighbour's key in range
+    cells = ((flat - low) // size).astype(np.int64) + 1
+    rows = int(cells[:, 1].max()) + 2
+    keys = cells[:, 0] * rows + cells[:, 1]
+    order = np.argsort(keys, kind="stable")
+    # where each cell's run starts in `order`, and how long it is
+    sizes = np.bincount(keys, minlength=(int(cells[:, 0].max()) + 2) * rows)
+    starts = np.cumsum(sizes) - sizes
+    everyone = np.arange(n)
+
+    found_a = []
+    found_b = []
+    for offset in [(0, 0)] + _HALF_NEIGHBOURS:
+        dx, dy = offset
+        target = keys + (dx * rows + dy)
+        counts = sizes[target]
+        total = counts.sum()
+        if not total:
+            continue
+
+        a = np.repeat(everyone, counts)
+        # position of each candidate within its cell's run of sorted keys
+        run = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        b = order[np.repeat(starts[target], counts) + run]
+        if offset == (0, 0):
+            keep = a < b
+            a, b = a[keep], b[keep]
+        found_a.append(a)
+        found_b.append(b)
+
+    if not found_a:
+        return np.empty(0, int), np.empty(0, int), np.empty(0)
+    a = np.concatenate(found_a)
+    b = np.concatenate(found_b)
+    diff = points[a] - points[b]
+    gaps = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+    close = gaps < distance
+    a, b = np.minimum(a, b)[close], np.maximum(a, b)[close]
+    return a, b, gaps[close]
+
+
+class CollisionDetector:
+    """Watches the flying drones of a simulation for collisions and near
+    misses, checking every physics tick.
+
+    An event is raised when a pair of drones first comes within
+    `near_miss_distance` (`"near_miss"`) or `collision_distance`
+    (`"collision"`) of each other, so a pair that collides raises both. Each
+    event is passed to every function in `callbacks`. They run on the physics
+    thread once the step has finished and the simulation lock is released, so
+    they can change drones, e.g. set an LED or call `emergency()`, but they
+    should return quickly and never wait on the simulation clock.
+
+    ```python
+    simulation.collisions.callbacks.append(print)
+    ...
+    print(simulation.collisions.stats())
+    ```
+    """
+
+    def __init__(self, collision_distance=COLLISION_DISTANCE,
+                 near_miss_distance=NEAR_MISS_DISTANCE, enabled=True):
+        self.collision_distance = collision_distance
+        self.near_miss_distance = near_miss_distance
+        self.enabled = enabled
+        self.callbacks = []
+        self.events = deque(maxlen=EVENT_HISTORY)
+        # events found by check() and not yet passed to the callbacks
+        self._undelivered = deque()
+        self.reset()
+
+    def reset(self):
+        """Clear the counters and forget which drones are close."""
+        self.collisions = 0
+        self.near_misses = 0
+        self.checks = 0
+        self.min_separation = np.inf
+        self._colliding = np.empty(0, np.int64)
+        self._near = np.empty(0, np.int64)
+        self.events.clear()
+        self._undelivered.clear()
+
+    def check(self, state, t):
+        """Look for drones in `state` that have come close at time `t`. New
+        events wait for `dispatch` to pass them to the callbacks."""
+        self.checks += 1
+        flying = np.flatnonzero(state.flying[:state.count])
+        # positions in cm: pixels across the screen, metres above the floor
+        points = state.pos[flying] * (1, 1, 100)
+        radius = max(self.near_miss_distance, self.collision_distance)
+        a, b, gaps = close_pairs(points, radius)
+        a, b = flying[a], flying[b]
+
+        if len(gaps):
+            self.min_separation = min(self.min_separation, float(gaps.min()))
+
+        pairs = (a.astype(np.int64) << 32) | b
+        near = pairs[gaps < self.near_miss_distance]
+        colliding = pairs[gaps < self.collision_distance]
+
+        new_near = np.setdiff1d(near, self._near, assume_unique=True)
+        new_colliding = np.setdiff1d(colliding, self._colliding, assume_unique=True)
+        self._near = np.sort(near)
+        self._colliding = np.sort(colliding)
+        self.near_misses += len(new_near)
+        self.collisions += len(new_colliding)
+
+        if len(new_near) or len(new_colliding):
+            gap = dict(zip(pairs.tolist(), gaps.tolist()))
+            for kind, found in (("near_miss", new_near), ("collision", new_colliding)):
+                for pair in found.tolist():
+                    event = ProximityEvent(kind, t, pair >> 32, pair & 0xFFFFFFFF, gap[pair])
+                    self.events.append(event)
+                    if self.callbacks:
+                        self._undelivered.append(event)
+
+    def dispatch(self):
+        """Pass the events found since the last call to every callback."""
+        while self._undelivered:
+            try:
+                event = self._undelivered.popleft()
+            except IndexError:
+                # another thread delivered it
+                return
+            for callback in self.callbacks:
+                callback(event)
+
+    def stats(self):
+        return {
+            "collisions": self.collisions,
+            "near_misses": self.near_misses,
+            "min_separation": self.min_separation,
+            "checks": self.checks,
+        }
@@ -1,20 +1,74 @@
 import logging
+from math import cos, sin, radians, pi, sqrt, atan2
 import time
-from random import randint, uniform
-from math import cos, sin, radians, pi
-from threading import Thread, Barrier
-from queue import Queue
+from threading import Barrier, Lock
+from concurrent.futures import ThreadPoolExecutor, wait
+from random import Random
 from typing import List, Callable
-from physicsSim import sim
+from contextvars import ContextVar
+from flightRecorder import FlightRecorder
+import telloCommands
+from physicsSim import sim, RealTimeClock, ScaledClock, VirtualClock, make_clock
 
 PI = pi
+# length of the straight segments a curve is flown as, in cm
+CURVE_SEGMENT = 20
+# shortest and longest delay the simulated link adds to a command, in seconds
+LATENCY_MIN = 0.1
+LATENCY_MAX = 0.5
+# most worker threads a swarm runs drones on at once; larger groups fly in waves
+SWARM_WORKERS = 32
+
+# created on the first Tello() so importing this module stays cheap
+SIMULATION = None
+# called instead of waiting by `sleep`, e.g. while a script is traced into a timeline
+SLEEP_HOOK = ContextVar("sleep_hook", default=None)
+# barrier of the `parallel` call the current drone is running in
+_SYNC_BARRIER = ContextVar("sync_barrier", default=None)
+
+
+def get_simulation():
+    """Return the shared simulation, starting a new one if there is none yet
+    or the last one has been shut down. Drones given a `simulation=` of
+    their own never use it.
+    """
+    global SIMULATION
+    if SIMULATION is None or not SIMULATION.running:
+        SIMULATION = sim()
+    return SIMULATION
+
+
+def set_simulation(simulation):
+    """Use `simulation` for every Tello created from now on, e.g.
+    `set_simulation(sim(headless=True, clock="fast"))`.
+    """
+    global SIMULATION
+    SIMULATION = simulation
+
+
+def sleep(seconds, simulation=None):
+    """Drop-in for `time.sleep` that waits in simulated time, so scripts keep
+    in step with the drones when the simulation clock runs faster than real time.
+    Waits on the shared simulation's clock unless given another `simulation`.
+    """
+    hook = SLEEP_HOOK.get()
+    if hook is not None:
+        return hook(seconds)
+    (simulation or get_simulation()).clock.sleep(seconds)
 
-SIMULATION = sim()
 
 class TelloException(Exception):
     pass
 
 
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0])
+
+
 class Tello:
     # Class variables
     TELLO_IP = "192.168.10.1"  # Tello IP address
@@ -33,12 +87,18 @@ class Tello:
     LOGGER.addHandler(HANDLER)
     LOGGER.setLevel(logging.DEBUG)
 
-    def __init__(self, host=TELLO_IP, swarm = False):
-        self.flightPathTaken = []
+    def __init__(self, host=TELLO_IP, swarm = False, simulation=None):
+        self.flightPathTaken = FlightRecorder()
         self.address = (host, Tello.CONTROL_UDP_PORT)
-        self.drone = {}
 
-        self.simulation = SIMULATION
+        # the shared simulation unless given one of its own
+        self.simulation = get_simulation() if simulation is None else simulation
+        # this drone's state lives in the simulation's swarm arrays
+        self.index = self.simulation.register(self)
+        self.drone = self.simulation.drone(self.index)
+        # each drone's latency has its own generator, so a seeded run doesn't
+        # depend on which thread happens to draw first
+        self.random = Random(self.simulation.random.getrandbits(64))
 
         self.drone["scl"] = 0.08
 
@@ -50,6 +110,8 @@ class Tello:
         self.drone["speed"] = 400
         self.drone["flip"] = 0
         self.drone["led"] = (0, 0, 0)
+        # colour of this drone's trail, None picks one from the palette
+        self.trail_colour = None
         self.swarm = swarm
 
         self.is_flying = False
@@ -62,59 +124,238 @@ class Tello:
                 host, Tello.CONTROL_UDP_PORT
             )
         )
-        self.simulation.register(self)
         if swarm is False:
             self.simulation.event_loop()
 
+    @property
+    def is_flying(self):
+        return bool(self.simulation.state.flying[self.index])
+
+    @is_flying.setter
+    def is_flying(self, value):
+        self.simulation.state.flying[self.index] = value
+
+    @property
+    def is_windy(self):
+        return bool(self.simulation.state.windy[self.index])
+
+    @is_windy.setter
+    def is_windy(self, value):
+        self.simulation.state.windy[self.index] = value
+
     def _setSwarmPos(self, i):
-        self.drone["pos"][0] += - 260 + 130 * (i % 4)
-        self.drone["pos"][1] += - 260 + 130 * (i // 4)
+        x, y, z = self.drone["pos"]
+        self.drone["pos"] = [x - 260 + 130 * (i % 4), y - 260 + 130 * (i // 4), z]
 
 
     def connect(self, wait_for_state=True):
         # Connect to the Tello drone
         if wait_for_state:
-            t = randint(1, 5) / 5
-            time.sleep(t)
+            t = self.random.randint(1, 5) / 5
+            self.simulation.clock.sleep(t)
             Tello.LOGGER.debug(
                 "'.connect()' received first state packet after {} seconds".format(t)
             )
 
-    def simLat(self, min=0.1, max=0.5):
+    def get_current_state(self) -> dict:
+        """Latest state packet as a dict, read from the simulation's telemetry.
+        """
+        telemetry = self.simulation.telemetry
+        frame = telemetry.frame(self.simulation.state, self.index)
+        values = frame.values[self.index].tolist()
+        return {
+            field: value if field in telemetry.FLOAT_FIELDS else int(value)
+            for field, value in zip(telemetry.FIELDS, values)
+        }
+
+    def get_state_field(self, key: str):
+        """Get a specific state field by name.
+        Internal method, you normally wouldn't call this yourself.
+        """
+        if key not in self.simulation.telemetry.COLUMN:
+            raise TelloException("Could not get state property: {}".format(key))
+        return self.simulation.telemetry.get(self.simulation.state, self.index, key)
+
+    def get_state_packet(self) -> str:
+        """Latest state packet, formatted as the drone sends it."""
+        return self.simulation.telemetry.packet(self.simulation.state, self.index)
+
+    def get_mission_pad_id(self) -> int:
+        """Mission pad ID of the currently detected mission pad.
+        Always -1, the simulation has no mission pads.
+        Returns:
+            int: -1
+        """
+        return self.get_state_field('mid')
+
+    def get_mission_pad_distance_x(self) -> int:
+        """X distance to current mission pad
+        Returns:
+            int: distance in cm
+        """
+        return self.get_state_field('x')
+
+    def get_mission_pad_distance_y(self) -> int:
+        """Y distance to current mission pad
+        Returns:
+            int: distance in cm
+        """
+        return self.get_state_field('y')
+
+    def get_mission_pad_distance_z(self) -> int:
+        """Z distance to current mission pad
+        Returns:
+            int: distance in cm
+        """
+        return self.get_state_field('z')
+
+    def get_pitch(self) -> int:
+        """Get pitch in degree
+        Returns:
+            int: pitch in degree
+        """
+        return self.get_state_field('pitch')
+
+    def get_roll(self) -> int:
+        """Get roll in degree
+        Returns:
+            int: roll in degree
+        """
+        return self.get_state_field('roll')
+
+    def get_yaw(self) -> int:
+        """Get yaw in degree
+        Returns:
+            int: yaw in degree
+        """
+        return self.get_state_field('yaw')
+
+    def get_speed_x(self) -> int:
+        """X-Axis Speed
+        Returns:
+            int: speed in dm/s
+        """
+        return self.get_state_field('vgx')
+
+    def get_speed_y(self) -> int:
+        """Y-Axis Speed
+        Returns:
+            int: speed in dm/s
+        """
+        return self.get_state_field('vgy')
+
+    def get_speed_z(self) -> int:
+        """Z-Axis Speed
+        Returns:
+            int: speed in dm/s
+        """
+        return self.get_state_field('vgz')
+
+    def get_acceleration_x(self) -> float:
+        """X-Axis Acceleration
+        Returns:
+            float: acceleration in 0.001g
+        """
+        return self.get_state_field('agx')
+
+    def get_acceleration_y(self) -> float:
+        """Y-Axis Acceleration
+        Returns:
+            float: acceleration in 0.001g
+        """
+        return self.get_state_field('agy')
+
+    def get_acceleration_z(self) -> float:
+        """Z-Axis Acceleration
+        Returns:
+            float: acceleration in 0.001g
+        """
+        return self.get_state_field('agz')
+
+    def get_lowest_temperature(self) -> int:
+        """Get lowest temperature
+        Returns:
+            int: lowest temperature (°C)
+        """
+        return self.get_state_field('templ')
+
+    def get_highest_temperature(self) -> int:
+        """Get highest temperature
+        Returns:
+            int: highest temperature (°C)
+        """
+        return self.get_state_field('temph')
+
+    def get_temperature(self) -> float:
+        """Get average temperature
+        Returns:
+            float: average temperature (°C)
+        """
+        return (self.get_lowest_temperature() + self.get_highest_temperature()) / 2
+
+    def get_height(self) -> int:
+        """Get current height in cm
+        Returns:
+            int: height in cm
+        """
+        return self.get_state_field('h')
+
+    def get_distance_tof(self) -> int:
+        """Get current distance value from TOF in cm
+        Returns:
+            int: TOF distance in cm
+        """
+        return self.get_state_field('tof')
+
+    def get_barometer(self) -> float:
+        """Get current barometer measurement in cm
+        Returns:
+            float: barometer measurement in cm
+        """
+        return self.get_state_field('baro')
+
+    def get_flight_time(self) -> int:
+        """Get the time the motors have been active in seconds
+        Returns:
+            int: flight time in s
+        """
+        return self.get_state_field('time')
+
+    def get_battery(self) -> int:
+        """Get current battery percentage
+        Returns:
+            int: 0-100
+        """
+        return self.get_state_field('bat')
+
+    def simLat(self, min=LATENCY_MIN, max=LATENCY_MAX):
         # wait a random amount of time
         if self.is_latency == False:
             return False
-        waitTime = uniform(min, max)
-        time.sleep(waitTime)
+        with self.simulation.profiler.timed("command.latency"):
+            self.simulation.clock.sleep(self._latency(min, max))
+
+    def _latency(self, min=LATENCY_MIN, max=LATENCY_MAX):
+        # how long the simulated link holds up the next command
+        if self.is_latency == False or not self.simulation.latency:
+            return 0
+        return self.random.uniform(min, max)
 
     def takeoff(self):
         Tello.LOGGER.info("sending takoff command to drone")
+        self._command("takeoff")
         self.simLat()
-        current_height = self.drone["pos"][2]
-
-        target_height = 1.5
-
-        height_diff = target_height - current_height
-        steps = int(max(abs(height_diff * 100 / self.drone["speed"] * 60), 1))
-        delta_height = height_diff / steps
+        motion = self._height_motion(1.5)
         self.is_flying = True
-        
-        for _ in range(steps):
-            self.drone["pos"][2] += delta_height
-            time.sleep(0.01)
+        self._travel(*motion)
 
     def land(self):
         Tello.LOGGER.info("sending land command to drone")
+        self._command("land")
+        self.simulation.set_rc(self.index)
         self.simLat()
         # Land the drone by gradually decreasing its z position to 1.0
-        target_height = 1.0
-        current_height = self.drone["pos"][2]
-        height_diff = target_height - current_height
-        steps = int(max(abs(height_diff * 100 / self.drone["speed"] * 60), 1))
-        delta_height = height_diff / steps
-        for _ in range(steps):
-            self.drone["pos"][2] += delta_height
-            time.sleep(0.01)
+        self._travel(*self._height_motion(1.0))
         self.is_flying = False
         if self.swarm is False:
             self.simulation.quit()
@@ -126,8 +367,98 @@ class Tello:
         if not self.is_flying:
             raise TelloException("Drone is not flying!")
 
+        self._command(f"{direction} {x}")
+        self.simLat()
+        self._travel(*self._move_motion(direction, x))
+
+    def rotate(self, direction: str, x: int):
+        Tello.LOGGER.info(
+            f"sending rotate command to drone in direction {direction} by {x} degrees"
+        )
+        
+        if not self.is_flying:
+            raise TelloException("Drone is not flying!")
+
+        self._command(f"{direction} {x}")
         self.simLat()
+        self._travel(*self._rotate_motion(direction, x))
+
+    def go_xyz_speed(self, x: int, y: int, z: int, speed: int):
+        """Fly to x y z relative to the current position.
+        Speed defines the traveling speed in cm/s.
+        Arguments:
+            x: -500-500
+            y: -500-500
+            z: -500-500
+            speed: 10-100
+        """
+        Tello.LOGGER.info(f"sending go command to drone to {x} {y} {z} at {speed}")
+        if not self.is_flying:
+            raise TelloException("Drone is not flying!")
+
+        self._command(f"go {x} {y} {z} {speed}")
+        self.simLat()
+        self._travel(*self._go_motion(x, y, z, speed))
+
+    def curve_xyz_speed(self, x1: int, y1: int, z1: int, x2: int, y2: int, z2: int, speed: int):
+        """Fly to x2 y2 z2 in a curve via x1 y1 z1. Speed defines the traveling speed in cm/s.
+
+        - Both points are relative to the current position
+        - The current position and both points must form a circle arc.
+        - If the arc radius is not within the range of 0.5-10 meters, it raises an Exception
+
+        Arguments:
+            x1: -500-500
+            y1: -500-500
+            z1: -500-500
+            x2: -500-500
+            y2: -500-500
+            z2: -500-500
+            speed: 10-60
+        """
+        Tello.LOGGER.info(
+            f"sending curve command to drone via {x1} {y1} {z1} to {x2} {y2} {z2} at {speed}"
+        )
+        if not self.is_flying:
+            raise TelloException("Drone is not flying!")
+
+        self._command(f"curve {x1} {y1} {z1} {x2} {y2} {z2} {speed}")
+        self.simLat()
+        self._travel_path(self._curve_motions(x1, y1, z1, x2, y2, z2, speed))
+
+    def set_speed(self, x: int):
+        """Set speed to x cm/s.
+        Arguments:
+            x: 10-100
+        """
+        self._command(f"speed {x}")
+        self.drone["speed"] = x * 4
+
+    def emergency(self):
+        """Stop all motors immediately.
+        """
+        self._command("emergency")
+        self.simulation.set_motion(self.index)
+        self.simulation.set_rc(self.index)
+        self.is_flying = False
+        # with the motors off it drops straight to the floor
+        x, y, _ = self.drone["pos"]
+        self.drone["pos"] = (x, y, 1.0)
 
+    def _command(self, cmd):
+        # let session recorders and other listeners see the command
+        self.simulation.command(self.index, cmd)
+
+    # Each _*_motion method works out a command's motion from the drone's
+    # current state as (offset, turn, steps), where `steps` is the number of
+    # 0.01 s steps the motion takes.
+
+    def _height_motion(self, target_height):
+        height_diff = target_height - self.drone["pos"][2]
+        steps = int(max(abs(height_diff * 100 / self.drone["speed"] * 60), 1))
+        return (0, 0, height_diff), 0, steps
+
+    def _move_motion(self, direction: str, x: int):
         current_x = self.drone["pos"][0]
         current_y = self.drone["pos"][1]
         current_z = self.drone["pos"][2]
@@ -165,25 +496,9 @@ class Tello:
         diff_z = target_z - current_z
         maxDiff = max(abs(diff_x), abs(diff_y), abs(diff_z) * 100)
         steps = int(max(maxDiff / self.drone["speed"] * 60, 1))
-        delta_x = diff_x / steps
-        delta_y = diff_y / steps
-        delta_z = diff_z / steps
-        for _ in range(steps):
-            self.drone["pos"][0] += delta_x
-            self.drone["pos"][1] += delta_y
-            self.drone["pos"][2] += delta_z
-            time.sleep(0.01)
-
-    def rotate(self, direction: str, x: int):
-        Tello.LOGGER.info(
-            f"sending rotate command to drone in direction {direction} by {x} degrees"
-        )
-        
-        if not self.is_flying:
-            raise TelloException("Drone is not flying!")
-
-        self.simLat()
+        return (diff_x, diff_y, diff_z), 0, steps
 
+    def _rotate_motion(self, direction: str, x: int):
         match direction:
             case "cw":
                 pass
@@ -191,15 +506,85 @@ class Tello:
                 x = -x
 
         steps = int(max(abs(x / self.drone["speed"] * 60), 1))
-        delta_x = x / steps
-        for i in range(steps):
-            self.drone["rot"] -= delta_x
-            time.sleep(0.01)
+        return (0, 0, 0), -x, steps
+
+    def _body_offset(self, x, y, z):
+        # x forward, y left and z up from the drone, in cm, as a simulation offset
+        angle_rad = radians(self.drone["rot"])
+        return (
+            x * sin(angle_rad) - y * cos(angle_rad),
+            x * cos(angle_rad) + y * sin(angle_rad),
+            z / 100,
+        )
+
+    def _go_motion(self, x, y, z, speed):
+        distance = sqrt(x * x + y * y + z * z)
+        steps = int(max(distance / (speed * 4) * 60, 1))
+        return self._body_offset(x, y, z), 0, steps
+
+    def _curve_motions(self, x1, y1, z1, x2, y2, z2, speed):
+        # the arc from here through the first point to the second, as a list
+        # of short straight motions
+        a = (x1, y1, z1)
+        b = (x2, y2, z2)
+        normal = _cross(a, b)
+        area = _dot(normal, normal)
+        if area == 0:
+            raise TelloException("Curve points are in a straight line")
+        # centre of the circle through the drone and both points
+        centre = [value / (2 * area) for value in _cross(
+            [_dot(a, a) * bv - _dot(b, b) * av for av, bv in zip(a, b)], normal
+        )]
+        radius = sqrt(_dot(centre, centre))
+        if not 50 <= radius <= 1000:
+            raise TelloException("Curve radius is not within 0.5-10 meters")
+
+        # the arc turns from `u`, the drone, towards `v`
+        u = [-value for value in centre]
+        size = sqrt(area)
+        v = _cross([value / size for value in normal], u)
+        relative = [bv - cv for bv, cv in zip(b, centre)]
+        end = atan2(_dot(relative, v), _dot(relative, u)) % (2 * pi)
+        segments = max(int(radius * end / CURVE_SEGMENT), 2)
+
+        motions = []
+        last = (0.0, 0.0, 0.0)
+        for k in range(1, segments + 1):
+            angle = end * k / segments
+            point = tuple(c + uv * cos(angle) + vv * sin(angle) for c, uv, vv in zip(centre, u, v))
+            step = [pv - lv for pv, lv in zip(point, last)]
+            steps = int(max(sqrt(_dot(step, step)) / (speed * 4) * 60, 1))
+            motions.append((self._body_offset(*step), 0, steps))
+            last = point
+        return motions
+
+    def _start_motion(self, offset, turn, steps):
+        # hand the motion to the physics thread and return how long it takes
+        duration = steps * 0.01
+        self.simulation.set_motion(self.index, offset, turn, duration)
+        return duration
+
+    def _start_motions(self, motions, landing=False):
+        # hand a path of motions to the physics thread and return how long it takes
+        path = [(offset, turn, steps * 0.01) for offset, turn, steps in motions]
+        self.simulation.set_motions(self.index, path, landing)
+        return sum(duration for _, _, duration in path)
+
+    def _travel(self, offset, turn, steps):
+        with self.simulation.profiler.timed("command.motion"):
+            duration = self._start_motion(offset, turn, steps)
+            self.simulation.wait_motion(self.index, duration)
+
+    def _travel_path(self, motions):
+        with self.simulation.profiler.timed("command.motion"):
+            duration = self._start_motions(motions)
+            self.simulation.wait_motion(self.index, duration)
 
     def flip(self, direction: str):
         Tello.LOGGER.info(
             f"sending flip command to drone in direction {direction}"
         )
+        self._command(f"flip {direction}")
         self.drone["flip"] = 24
 
     def flip_left(self):
@@ -246,42 +631,119 @@ class Tello:
         # Simulate rotating the tello clockwise by `x` amount.
         self.rotate("ccw", x)
 
-    def send_command_without_return(self, cmd):
+    def send_rc_control(self, left_right_velocity: int, forward_backward_velocity: int,
+                        up_down_velocity: int, yaw_velocity: int):
+        """Send RC control via four channels. Returns at once; the drone
+        keeps flying the latest values until new ones are sent, so control
+        loops can stream them at any rate.
+
+        Arguments:
+            left_right_velocity: -100~100 (left/right)
+            forward_backward_velocity: -100~100 (forward/backward)
+            up_down_velocity: -100~100 (up/down)
+            yaw_velocity: -100~100 (yaw)
+        """
+        # like djitellopy, rc commands are too frequent to log or record
+        self.simulation.set_rc(self.index, (
+            max(-100, min(100, int(left_right_velocity))),
+            max(-100, min(100, int(forward_backward_velocity))),
+            max(-100, min(100, int(up_down_velocity))),
+            max(-100, min(100, int(yaw_velocity))),
+        ))
+
+    def send_command_with_return(self, command: str, timeout: int = 7) -> str:
+        """Send an SDK command, e.g. "forward 50" or "battery?", and wait for
+        its response: "ok", the value asked for, or "error" and the reason.
+        `timeout` is only there for compatibility with djitellopy.
+        """
+        try:
+            sdk_command, args = telloCommands.parse(command)
+            response = sdk_command.call(self, *args)
+        except (TelloException, ValueError) as e:
+            return "error {}".format(e)
+        return "ok" if response is None else response
+
+    def send_command_without_return(self, cmd: str):
+        """Send an SDK command without waiting for it to be carried out.
+        Motions are handed to the physics thread at once, without the
+        simulated latency; errors are only logged.
+        """
+        try:
+            sdk_command, args = telloCommands.parse(cmd)
+            if sdk_command.plan is None:
+                sdk_command.call(self, *args)
+            else:
+                self._start_plan(sdk_command.name, sdk_command.plan(self, *args), cmd)
+        except (TelloException, ValueError) as e:
+            self.LOGGER.warning("{}: {}".format(cmd, e))
+
+    def _start_plan(self, name, motions, cmd):
+        # start a planned motion command without waiting for it
+        self._command(cmd)
+        if name == "takeoff":
+            self.is_flying = True
+        elif name == "land":
+            self.simulation.set_rc(self.index)
+        # a landing drone flies until it touches down
+        self._start_motions(motions, landing=name == "land")
+
+    def _ext(self, cmd):
+        # EXT commands for the expansion module's LED and matrix
+        self._command(cmd)
         c = cmd.split()
-        if c[0] == "EXT" and c[1] == "led":
-            self.drone["led"] = (int(c[2]), int(c[3]), int(c[4]))
+        if len(c) < 3:
+            raise ValueError("EXT needs a module command")
+        if c[1] == "led":
+            # EXT led r g b, or EXT led br|bl <period> r g b ...: a breathing
+            # or blinking LED is shown in its first colour
+            first = 2
+            if c[2] in ("br", "bl"):
+                first = 4
+                if len(c) < 4 or float(c[3]) <= 0:
+                    raise ValueError("EXT led {} needs a period in seconds".format(c[2]))
+            if len(c) < first + 3:
+                raise ValueError("EXT led needs a red, green and blue value")
+            self.drone["led"] = tuple(max(0, min(255, int(v))) for v in c[first:first + 3])
+        elif c[1] == "mled":
+            # patterns are parsed once per distinct command and shared by every drone
+            show = self.simulation.matrix.show(cmd)
+            if show is not None:
+                self.drone["mled"] = show
+                self.drone["mled_start"] = self.simulation.clock.now()
         else:
-            pass
+            raise ValueError("unknown EXT command: {}".format(c[1]))
 
 class TelloSwarm:
     """Swarm library for controlling multiple Tellos simultaneously
     """
 
     @staticmethod
-    def fromFile(path: str):
+    def fromFile(path: str, simulation=None):
         """Create TelloSwarm from file. The file should contain one IP address per line.
 
         Arguments:
             path: path to the file
+            simulation: simulation to fly in, the shared one if not given
         """
         with open(path, 'r') as fd:
             ips = fd.readlines()
 
-        return TelloSwarm.fromIps(ips)
+        return TelloSwarm.fromIps(ips, simulation)
 
     @staticmethod
-    def fromIps(ips: list):
+    def fromIps(ips: list, simulation=None):
         """Create TelloSwarm from a list of IP addresses.
 
         Arguments:
             ips: list of IP Addresses
+            simulation: simulation to fly in, the shared one if not given
         """
         if not ips:
             raise TelloException("No ips provided")
 
         tellos = []
         for ip in ips:
-            tellos.append(Tello(ip.strip(), swarm = True))
+            tellos.append(Tello(ip.strip(), swarm = True, simulation=simulation))
 
         for i in range(len(tellos)):
             tellos[i]._setSwarmPos(i)
@@ -290,33 +752,26 @@ class TelloSwarm:
 
         return TelloSwarm(tellos)
 
-    def __init__(self, tellos: List[Tello]):
+    def __init__(self, tellos: List[Tello], workers: int = None):
         """Initialize a TelloSwarm instance
 
         Arguments:
             tellos: list of [Tello][tello] instances
+            workers: most threads `parallel` runs drones on at once, one per
+                drone up to `SWARM_WORKERS` by default. Threads are started
+                as they are needed and reused between calls. Larger groups
+                fly in waves, and `sync` needs a thread for every drone of
+                the group.
         """
+        self.simulation = tellos[0].simulation if tellos else get_simulation()
+        if any(tello.simulation is not self.simulation for tello in tellos):
+            raise TelloException("All drones in a swarm must be in the same simulation")
         self.tellos = tellos
         self.barrier = Barrier(len(tellos))
-        self.funcBarrier = Barrier(len(tellos) + 1)
-        self.funcQueues = [Queue() for tello in tellos]
-        self.simulation = SIMULATION
-
-        def worker(i):
-            queue = self.funcQueues[i]
-            tello = self.tellos[i]
-
-            while True:
-                func = queue.get()
-                self.funcBarrier.wait()
-                func(i, tello)
-                self.funcBarrier.wait()
-
-        self.threads = []
-        for i, _ in enumerate(tellos):
-            thread = Thread(target=worker, daemon=True, args=(i,))
-            thread.start()
-            self.threads.append(thread)
+        self.workers = workers or max(min(len(tellos), SWARM_WORKERS), 1)
+        self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix="tello")
+        # futures of the drones still running a function
+        self._pending = set()
 
         self.simulation.event_loop()
 
@@ -333,27 +788,115 @@ class TelloSwarm:
         for i, tello in enumerate(self.tellos):
             func(i, tello)
 
-    def parallel(self, func: Callable[[int, Tello], None]):
+    def submit(self, func: Callable[[int, Tello], object], indices: List[int] = None):
+        """Start `func` for each tello in `indices`, or every tello, on the
+        worker pool and return a future per drone without waiting for them.
+
+        ```python
+        futures = swarm.submit(lambda i, tello: tello.move_up(100), BACKROW)
+        ```
+        """
+        group = range(len(self.tellos)) if indices is None else list(indices)
+        for i in group:
+            if not 0 <= i < len(self.tellos):
+                raise TelloException("No drone {} in a swarm of {}".format(i, len(self.tellos)))
+        clock = self.simulation.clock
+        profiler = self.simulation.profiler
+        if profiler.enabled:
+            profiler.gauge("swarm.queue_depth", len(self._pending))
+
+        # sync() waits for the drones of this call only
+        barrier = Barrier(len(group))
+        queued = time.perf_counter()
+
+        # the drones join the clock together so none of them races ahead, but
+        # only as many as there are workers for; a drone waiting for a worker
+        # would hold the clock up for good. Each drone that finishes hands its
+        # place on to the next one waiting.
+        first = min(len(group), self.workers)
+        waiting = len(group) - first
+        handoff = Lock()
+
+        def hand_on():
+            nonlocal waiting
+            with handoff:
+                if not waiting:
+                    return False
+                waiting -= 1
+                return True
+
+        def run(i, tello):
+            if profiler.enabled:
+                profiler.add("swarm.start_wait", time.perf_counter() - queued)
+            token = _SYNC_BARRIER.set(barrier)
+            try:
+                with clock.participate(reserved=True):
+                    try:
+                        return func(i, tello)
+                    finally:
+                        if hand_on():
+                            clock.reserve()
+            except BaseException:
+                # rather than leave the rest of the group waiting in sync()
+                barrier.abort()
+                raise
+            finally:
+                _SYNC_BARRIER.reset(token)
+
+        clock.reserve(first)
+        futures = []
+        try:
+            for i in group:
+                future = self.pool.submit(run, i, self.tellos[i])
+                self._pending.add(future)
+                future.add_done_callback(self._pending.discard)
+                futures.append(future)
+        except BaseException:
+            # drones that never started would hold the clock up for good
+            with handoff:
+                unstarted = len(group) - len(futures)
+                # the last drones are the ones still waiting for a place
+                unplaced = min(waiting, unstarted)
+                waiting -= unplaced
+            clock.release(unstarted - unplaced)
+            raise
+        return futures
+
+    def parallel(self, func: Callable[[int, Tello], object], indices: List[int] = None):
         """Call `func` for each tello in parallel. The function retrieves
         two arguments: The index `i` of the current drone and `tello` the
         current [Tello][tello] instance.
 
+        Only the drones in `indices` are called if given. Returns what `func`
+        returned for each of them in turn, or the exception it raised.
+
         You can use `swarm.sync()` for syncing between threads.
 
         ```python
         swarm.parallel(lambda i, tello: tello.move_up(50 + i * 10))
+        swarm.parallel(lambda i, tello: tello.flip_back(), BACKROW)
         ```
         """
-
-        for queue in self.funcQueues:
-            queue.put(func)
-
-        self.funcBarrier.wait()
-        self.funcBarrier.wait()
+        group = range(len(self.tellos)) if indices is None else list(indices)
+        with self.simulation.profiler.timed("swarm.parallel"):
+            futures = self.submit(func, group)
+            # a drone that starts a group of its own mustn't hold the clock up
+            with self.simulation.clock.idle():
+                wait(futures)
+
+        results = []
+        for i, future in zip(group, futures):
+            error = future.exception()
+            if error is not None:
+                Tello.LOGGER.error("drone {} raised {!r}".format(i, error))
+                results.append(error)
+            else:
+                results.append(future.result())
+        return results
 
     def sync(self, timeout: float = None):
-        """Sync parallel tello threads. The code continues when all threads
-        have called `swarm.sync`.
+        """Sync parallel tello threads. The code continues when all drones
+        of the current `parallel` call have called `swarm.sync`.
 
         ```python
         def doStuff(i, tello):
@@ -368,13 +911,31 @@ class TelloSwarm:
         swarm.parallel(doStuff)
         ```
         """
-        return self.barrier.wait(timeout)
+        barrier = _SYNC_BARRIER.get() or self.barrier
+        if barrier.parties > self.workers:
+            # drones of the group still waiting for a worker would never arrive
+            raise TelloException("swarm.sync() needs a worker for each of the {} drones, "
+                                 "the swarm has {}".format(barrier.parties, self.workers))
+        with self.simulation.clock.idle(), self.simulation.profiler.timed("swarm.sync_wait"):
+            return barrier.wait(timeout)
 
     def land(self):
         for t in self.tellos:
             t.land()
+        self.close()
         self.simulation.quit()
 
+    def close(self):
+        """Let the worker threads finish once they are idle. The swarm can't
+        run `parallel` after this."""
+        self.pool.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
     def __getattr__(self, attr):
         """Call a standard tello function in parallel on all tellos.
 
@@ -385,7 +946,7 @@ class TelloSwarm:
         ```
         """
         def callAll(*args, **kwargs):
-            self.parallel(lambda i, tello: getattr(tello, attr)(*args, **kwargs))
+            return self.parallel(lambda i, tello: getattr(tello, attr)(*args, **kwargs))
 
         return callAll
 
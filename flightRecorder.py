@@ -0,0 +1,120 @@
+import numpy as np
+
+# samples per second kept by each drone's recorder (0 records every update)
+FLIGHT_RECORD_RATE = 30
+# samples held in memory per drone
+FLIGHT_RECORD_CAPACITY = 6000
+
+
+class FlightRecorder:
+    """Fixed-size ring buffer of timestamped drone positions.
+
+    Each sample is a `(t, x, y, z)` row in a preallocated NumPy array, so memory
+    use does not grow with flight time. Once the buffer is full the oldest
+    samples are overwritten or, if `spill` names a file, written there a chunk
+    at a time and read back through a memory map by `between`.
+
+    Iterating the recorder yields `(x, y, z)` tuples, oldest first, like the
+    list `Tello.flightPathTaken` used to be.
+    """
+
+    def __init__(self, capacity=FLIGHT_RECORD_CAPACITY, rate=FLIGHT_RECORD_RATE, spill=None):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.rate = rate
+        self.spill = spill
+        self._data = np.empty((capacity, 4))
+        self._start = 0
+        self._count = 0
+        self._spilled = 0
+        self._last = -np.inf
+        if spill is not None:
+            open(spill, "wb").close()
+
+    def record(self, t, pos):
+        """Store `pos` at time `t` unless the last sample is too recent.
+        Returns True if the sample was kept."""
+        # small tolerance so float jitter in `t` does not skip a sample
+        if self.rate and t - self._last < 1 / self.rate - 1e-9:
+            return False
+        self._last = t
+
+        if self._count == self.capacity:
+            if self.spill is not None:
+                self._spill_oldest(max(self.capacity // 4, 1))
+            else:
+                self._start = (self._start + 1) % self.capacity
+                self._count -= 1
+
+        row = self._data[(self._start + self._count) % self.capacity]
+        row[0] = t
+        row[1:] = pos[:3]
+        self._count += 1
+        return True
+
+    def _spill_oldest(self, count):
+        with open(self.spill, "ab") as fd:
+            for part in self._parts(count):
+                fd.write(part.tobytes())
+        self._start = (self._start + count) % self.capacity
+        self._count -= count
+        self._spilled += count
+
+    def _parts(self, count=None):
+        # the first `count` samples in time order, as at most two array views
+        count = self._count if count is None else count
+        end = self._start + count
+        if end <= self.capacity:
+            return [self._data[self._start:end]]
+        return [self._data[self._start:], self._data[:end - self.capacity]]
+
+    def spilled(self):
+        """Samples written to the spill file, as a read-only memory map."""
+        if not self._spilled:
+            return np.empty((0, 4))
+        return np.memmap(self.spill, dtype=self._data.dtype, mode="r", shape=(self._spilled, 4))
+
+    def array(self):
+        """Copy of the in-memory samples as an `(n, 4)` array of t, x, y, z."""
+        return np.concatenate(self._parts())
+
+    def between(self, start=-np.inf, end=np.inf):
+        """Samples with `start <= t < end`, including any spilled to disk."""
+        chunks = [self.spilled()] + self._parts()
+        found = []
+        for chunk in chunks:
+            if not len(chunk):
+                continue
+            lo, hi = np.searchsorted(chunk[:, 0], (start, end))
+            if hi > lo:
+                found.append(np.array(chunk[lo:hi]))
+        return np.concatenate(found) if found else np.empty((0, 4))
+
+    def latest(self):
+        """Most recent `(x, y, z)` sample, or None."""
+        if not self._count:
+            return None
+        return tuple(self._data[(self._start + self._count - 1) % self.capacity, 1:].tolist())
+
+    def clear(self):
+        self._start = 0
+        self._count = 0
+        self._spilled = 0
+        self._last = -np.inf
+        if self.spill is not None:
+            open(self.spill, "wb").close()
+
+    @property
+    def nbytes(self):
+        """Memory held by the ring buffer."""
+        return self._data.nbytes
+
+    def __len__(self):
+        return self._count + self._spilled
+
+    def __iter__(self):
+        for part in [self.spilled()] + self._parts():
+            for row in part[:, 1:].tolist():
+                yield tuple(row)
+
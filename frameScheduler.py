@@ -0,0 +1,133 @@
+"""Pacing of the simulation window's render loop."""
+import time
+from collections import deque
+
+# frames averaged before the scheduler steps its rate down or back up
+DEGRADE_WINDOW = 30
+# each step down draws this fraction of the frames of the one above
+DEGRADE_STEP = 0.75
+
+
+class FrameScheduler:
+    """Paces a render loop at `fps` frames per second.
+
+    Frames fall due on a fixed grid of deadlines, so the time spent drawing
+    comes out of the wait instead of adding to it, and the rate holds while
+    frames cost less than the interval. A loop more than a frame behind
+    starts again from the current time rather than drawing a burst to catch
+    up. Loops can skip frames with nothing new to draw, and these are counted
+    separately.
+
+    With `degrade` set, a loop whose frames keep costing more than the
+    interval steps down to lower rates, as far as `min_fps`. After that,
+    `trails` turns False for the caller to stop drawing trails. It steps back
+    up once frames would fit comfortably at the rate above.
+
+    ```python
+    frames = FrameScheduler(30)
+    while running:
+        frames.wait()
+        start = time.perf_counter()
+        draw()
+        frames.drawn(time.perf_counter() - start)
+    ```
+    """
+
+    def __init__(self, fps=60, degrade=False, min_fps=15, clock=time.perf_counter, sleep=time.sleep):
+        self.degrade = degrade
+        self.min_fps = min_fps
+        self._clock = clock
+        self._sleep = sleep
+        self.frames = 0
+        self.skipped = 0
+        # deadlines missed by more than a frame
+        self.late = 0
+        self.level = 0
+        self.target_fps = fps
+        self._next = None
+        self._costs = deque(maxlen=DEGRADE_WINDOW)
+        # when each frame of the last second was drawn
+        self._times = deque()
+
+    @property
+    def target_fps(self):
+        return self._rates[0]
+
+    @target_fps.setter
+    def target_fps(self, fps):
+        if fps <= 0:
+            raise ValueError("The frame rate must be positive")
+        rates = [fps]
+        while rates[-1] * DEGRADE_STEP > self.min_fps:
+            rates.append(rates[-1] * DEGRADE_STEP)
+        if rates[-1] > self.min_fps:
+            rates.append(self.min_fps)
+        self._rates = rates
+        self.level = 0
+
+    @property
+    def fps(self):
+        """Rate frames are currently paced at."""
+        return self._rates[min(self.level, len(self._rates) - 1)]
+
+    @property
+    def interval(self):
+        return 1 / self.fps
+
+    @property
+    def trails(self):
+        """False once the loop has degraded past its lowest rate."""
+        return self.level < len(self._rates)
+
+    def wait(self):
+        """Sleep until the next frame is due."""
+        now = self._clock()
+        if self._next is None:
+            self._next = now
+        delay = self._next - now
+        if delay > 0:
+            self._sleep(delay)
+        elif -delay > self.interval:
+            self.late += 1
+            self._next = now
+        self._next += self.interval
+
+    def skip(self):
+        """Count a frame not drawn because nothing changed."""
+        self.skipped += 1
+
+    def drawn(self, seconds):
+        """Count a frame that took `seconds` to draw."""
+        self.frames += 1
+        now = self._clock()
+        self._times.append(now)
+        while now - self._times[0] > 1:
+            self._times.popleft()
+
+        self._costs.append(seconds)
+        if self.degrade and len(self._costs) == self._costs.maxlen:
+            cost = sum(self._costs) / len(self._costs)
+            if cost > self.interval * 0.9 and self.level < len(self._rates):
+                self._step(1)
+            elif self.level and cost < 0.5 / self._rates[self.level - 1]:
+                self._step(-1)
+
+    def _step(self, direction):
+        self.level += direction
+        self._costs.clear()
+
+    def stats(self):
+        now = self._clock()
+        recent = sum(1 for t in self._times if now - t <= 1)
+        costs = self._costs
+        return {
+            "target_fps": self.target_fps,
+            "fps": self.fps,
+            "measured_fps": recent,
+            "frame_ms": sum(costs) / len(costs) * 1000 if costs else 0.0,
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "late": self.late,
+            "level": self.level,
+            "trails": self.trails,
+        }
@@ -0,0 +1,298 @@
+"""8x8 matrix LED of the Tello Talent (RoboMaster TT) expansion module.
+
+Scripts drive it with `EXT mled` commands:
+
+    EXT mled g <pattern>               show a 64 character pattern
+    EXT mled s <colour> <char|heart>   show a single character
+    EXT mled l|r|u|d <colour> <rate> <text>
+                                       scroll text left, right, up or down
+                                       by <rate> pixels per second
+    EXT mled l|r|u|d g <rate> <pattern>
+                                       scroll a pattern round the matrix
+    EXT mled sc                        clear the matrix
+
+Patterns list the rows from the top, eight characters each: `r`, `b` and
+`p` light a pixel red, blue or purple and `0` leaves it off.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+MATRIX_COLOURS = {"r": (255, 40, 40), "b": (40, 90, 255), "p": (220, 50, 220)}
+MATRIX_OFF = (30, 30, 30)
+# scaled matrix surfaces kept by the render loop
+MATRIX_CACHE_SIZE = 512
+# width of the matrix drawn on a drone, as a fraction of the sprite's
+MATRIX_SCALE = 0.3
+
+BLANK = "0" * 64
+HEART = "0pp00pp0" "pppppppp" "pppppppp" "pppppppp" "0pppppp0" "00pppp00" "000pp000" "00000000"
+
+# 5x7 font, one byte per column with the top row in bit 0; lower case
+# letters are shown as capitals and unknown characters as "?"
+FONT = {
+    " ": (0x00, 0x00, 0x00, 0x00, 0x00),
+    "!": (0x00, 0x00, 0x5F, 0x00, 0x00),
+    '"': (0x00, 0x07, 0x00, 0x07, 0x00),
+    "#": (0x14, 0x7F, 0x14, 0x7F, 0x14),
+    "%": (0x23, 0x13, 0x08, 0x64, 0x62),
+    "'": (0x00, 0x05, 0x03, 0x00, 0x00),
+    "(": (0x00, 0x1C, 0x22, 0x41, 0x00),
+    ")": (0x00, 0x41, 0x22, 0x1C, 0x00),
+    "*": (0x14, 0x08, 0x3E, 0x08, 0x14),
+    "+": (0x08, 0x08, 0x3E, 0x08, 0x08),
+    ",": (0x00, 0x50, 0x30, 0x00, 0x00),
+    "-": (0x08, 0x08, 0x08, 0x08, 0x08),
+    ".": (0x00, 0x60, 0x60, 0x00, 0x00),
+    "/": (0x20, 0x10, 0x08, 0x04, 0x02),
+    "0": (0x3E, 0x51, 0x49, 0x45, 0x3E),
+    "1": (0x00, 0x42, 0x7F, 0x40, 0x00),
+    "2": (0x42, 0x61, 0x51, 0x49, 0x46),
+    "3": (0x21, 0x41, 0x45, 0x4B, 0x31),
+    "4": (0x18, 0x14, 0x12, 0x7F, 0x10),
+    "5": (0x27, 0x45, 0x45, 0x45, 0x39),
+    "6": (0x3C, 0x4A, 0x49, 0x49, 0x30),
+    "7": (0x01, 0x71, 0x09, 0x05, 0x03),
+    "8": (0x36, 0x49, 0x49, 0x49, 0x36),
+    "9": (0x06, 0x49, 0x49, 0x29, 0x1E),
+    ":": (0x00, 0x36, 0x36, 0x00, 0x00),
+    ";": (0x00, 0x56, 0x36, 0x00, 0x00),
+    "<": (0x08, 0x14, 0x22, 0x41, 0x00),
+    "=": (0x14, 0x14, 0x14, 0x14, 0x14),
+    ">": (0x00, 0x41, 0x22, 0x14, 0x08),
+    "?": (0x02, 0x01, 0x51, 0x09, 0x06),
+    "A": (0x7E, 0x11, 0x11, 0x11, 0x7E),
+    "B": (0x7F, 0x49, 0x49, 0x49, 0x36),
+    "C": (0x3E, 0x41, 0x41, 0x41, 0x22),
+    "D": (0x7F, 0x41, 0x41, 0x22, 0x1C),
+    "E": (0x7F, 0x49, 0x49, 0x49, 0x41),
+    "F": (0x7F, 0x09, 0x09, 0x09, 0x01),
+    "G": (0x3E, 0x41, 0x49, 0x49, 0x7A),
+    "H": (0x7F, 0x08, 0x08, 0x08, 0x7F),
+    "I": (0x00, 0x41, 0x7F, 0x41, 0x00),
+    "J": (0x20, 0x40, 0x41, 0x3F, 0x01),
+    "K": (0x7F, 0x08, 0x14, 0x22, 0x41),
+    "L": (0x7F, 0x40, 0x40, 0x40, 0x40),
+    "M": (0x7F, 0x02, 0x0C, 0x02, 0x7F),
+    "N": (0x7F, 0x04, 0x08, 0x10, 0x7F),
+    "O": (0x3E, 0x41, 0x41, 0x41, 0x3E),
+    "P": (0x7F, 0x09, 0x09, 0x09, 0x06),
+    "Q": (0x3E, 0x41, 0x51, 0x21, 0x5E),
+    "R": (0x7F, 0x09, 0x19, 0x29, 0x46),
+    "S": (0x46, 0x49, 0x49, 0x49, 0x31),
+    "T": (0x01, 0x01, 0x7F, 0x01, 0x01),
+    "U": (0x3F, 0x40, 0x40, 0x40, 0x3F),
+    "V": (0x1F, 0x20, 0x40, 0x20, 0x1F),
+    "W": (0x3F, 0x40, 0x38, 0x40, 0x3F),
+    "X": (0x63, 0x14, 0x08, 0x14, 0x63),
+    "Y": (0x07, 0x08, 0x70, 0x08, 0x07),
+    "Z": (0x61, 0x51, 0x49, 0x45, 0x43),
+    "_": (0x40, 0x40, 0x40, 0x40, 0x40),
+}
+
+# what a matrix shows: patterns stepped through at `rate` per second, or
+# the first pattern for good if `rate` is 0
+Show = namedtuple("Show", "frames rate")
+
+
+def _glyph(char, colour):
+    """Columns of `char`, top to bottom, with a blank eighth row."""
+    columns = FONT.get(char.upper(), FONT["?"])
+    return ["".join(colour if bits >> row & 1 else "0" for row in range(8)) for bits in columns]
+
+
+def _from_columns(columns):
+    return "".join(column[row] for row in range(8) for column in columns)
+
+
+def _check_pattern(pattern):
+    if len(pattern) != 64 or set(pattern) - set("rbp0"):
+        raise ValueError("A matrix pattern is 64 of the characters r, b, p and 0")
+    return pattern
+
+
+def _check_colour(colour):
+    if colour not in MATRIX_COLOURS:
+        raise ValueError("Matrix colours are r, b and p, not {}".format(colour))
+    return colour
+
+
+def character(colour, char):
+    """Pattern showing `char`, or a heart for "heart", in `colour`."""
+    if char == "heart":
+        return HEART.replace("p", colour)
+    blank = "0" * 8
+    return _from_columns([blank] + _glyph(char, colour) + [blank, blank])
+
+
+def scroll(direction, colour, text):
+    """Every pattern of `text` scrolling across the matrix in `direction`,
+    entering on one side and leaving by the other."""
+    blank = "0" * 8
+    if direction in "lr":
+        columns = [blank] * 8
+        for char in text:
+            columns += _glyph(char, colour) + [blank]
+        columns += [blank] * 7
+        frames = [_from_columns(columns[k:k + 8]) for k in range(len(columns) - 7)]
+    else:
+        # characters stacked one above the next
+        rows = ["0" * 8] * 8
+        for char in text:
+            pattern = character(colour, char)
+            rows += [pattern[row * 8:row * 8 + 8] for row in range(8)]
+        rows += ["0" * 8] * 8
+        frames = ["".join(rows[k:k + 8]) for k in range(len(rows) - 7)]
+    return frames if direction in "lu" else frames[::-1]
+
+
+def scroll_pattern(direction, pattern):
+    """The patterns of `pattern` turning round the matrix one pixel at a time."""
+    rows = [pattern[row * 8:row * 8 + 8] for row in range(8)]
+    frames = []
+    for k in range(8):
+        if direction in "lr":
+            shift = k if direction == "l" else -k
+            frames.append("".join(row[shift:] + row[:shift] for row in rows))
+        else:
+            shift = k if direction == "u" else -k
+            frames.append("".join(rows[shift:] + rows[:shift]))
+    return frames
+
+
+def parse(command):
+    """`Show` for an `EXT mled` command, None for commands that clear the
+    matrix, or False for settings that leave it as it is. Raises ValueError
+    for commands the module would reject."""
+    words = command.split(None, 5)
+    if len(words) < 3 or words[0] != "EXT" or words[1] != "mled":
+        raise ValueError("Not a matrix command: {}".format(command))
+    try:
+        match words[2]:
+            case "g":
+                return Show((_check_pattern(words[3]),), 0.0)
+            case "s":
+                return Show((character(_check_colour(words[3]), words[4]),), 0.0)
+            case "l" | "r" | "u" | "d":
+                rate = min(max(float(words[4]), 0.1), 10.0)
+                if words[3] == "g":
+                    return Show(tuple(scroll_pattern(words[2], _check_pattern(words[5]))), rate)
+                text = words[5]
+                if len(text) > 70:
+                    raise ValueError("Matrix text is at most 70 characters")
+                return Show(tuple(scroll(words[2], _check_colour(words[3]), text)), rate)
+            case "sc":
+                return None
+            case "sl" | "sg":
+                # brightness and the pattern shown at power on
+                return False
+    except IndexError:
+        pass
+    raise ValueError("Unknown matrix command: {}".format(command))
+
+
+class MatrixDisplay:
+    """The patterns shown on a simulation's matrix LEDs.
+
+    Each distinct command is parsed once and given an id, which is all a
+    drone stores, so resending the same pattern costs a dictionary lookup.
+    Drawing works the same way: every pattern is turned into an 8x8 surface
+    once, and the scaled copies the render loop blits are kept in a bounded
+    LRU cache shared by every drone showing that pattern at that size.
+    """
+
+    def __init__(self, capacity=MATRIX_CACHE_SIZE):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        # id 0 is a blank matrix
+        self.shows = [None]
+        self._ids = {}
+        self._lock = threading.Lock()
+        self._bitmaps = {}
+        self._surfaces = OrderedDict()
+
+    def show(self, command):
+        """Id of what `command` puts on the matrix, 0 for a blank matrix, or
+        None if it leaves the matrix unchanged."""
+        show_id = self._ids.get(command)
+        if show_id is not None:
+            return show_id
+        show = parse(command)
+        if show is False:
+            return None
+        with self._lock:
+            show_id = self._ids.get(command)
+            if show_id is None:
+                if show is None:
+                    show_id = 0
+                else:
+                    show_id = len(self.shows)
+                    self.shows.append(show)
+                self._ids[command] = show_id
+        return show_id
+
+    def commands(self):
+        """A command that puts each show on the matrix, by show id, "" for
+        the blank matrix. `show` gives the same shows back from these."""
+        with self._lock:
+            ids = list(self._ids.items())
+        commands = [""] * (max((show_id for _, show_id in ids), default=0) + 1)
+        for command, show_id in ids:
+            if show_id:
+                commands[show_id] = command
+        return commands
+
+    def patterns(self, show_ids, elapsed):
+        """Pattern each drone shows, given its show id and the seconds since
+        it was set, or None for a blank matrix."""
+        patterns = []
+        for show_id, seconds in zip(show_ids.tolist(), elapsed.tolist()):
+            show = self.shows[show_id]
+            if show is None:
+                patterns.append(None)
+            elif show.rate:
+                patterns.append(show.frames[int(seconds * show.rate) % len(show.frames)])
+            else:
+                patterns.append(show.frames[0])
+        return patterns
+
+    def animated(self, show_ids):
+        """True if any of `show_ids` scrolls."""
+        return any(self.shows[show_id].rate for show_id in set(show_ids.tolist()) if show_id)
+
+    def surface(self, pattern, size):
+        """`pattern` drawn `size` pixels square."""
+        key = (pattern, size)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self._surfaces.move_to_end(key)
+            return surface
+
+        # only ever called while drawing, when pygame is already loaded
+        import pygame
+
+        self.misses += 1
+        bitmap = self._bitmaps.get(pattern)
+        if bitmap is None:
+            bitmap = self._bitmaps[pattern] = pygame.Surface((8, 8))
+            for k, pixel in enumerate(pattern):
+                bitmap.set_at((k % 8, k // 8), MATRIX_COLOURS.get(pixel, MATRIX_OFF))
+        surface = pygame.transform.scale(bitmap, (size, size))
+
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.capacity:
+            self._surfaces.popitem(last=False)
+        return surface
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "shows": len(self.shows) - 1,
+            "patterns": len(self._bitmaps),
+            "size": len(self._surfaces),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
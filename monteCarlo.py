@@ -0,0 +1,221 @@
+"""Monte Carlo robustness runs of a choreography.
+
+Flies the same script again and again, headless and on the discrete-event
+clock, each time with a different seed for the wind and latency. The final
+positions and command times are compared with a calm reference run that has
+neither, and the closest approach between drones is taken from the collision
+detector:
+
+    python monteCarlo.py testSwarm2.py --runs 1000 --output report.json
+"""
+import io
+import os
+import sys
+import json
+import runpy
+import argparse
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from physicsSim import sim
+from collisionDetector import close_pairs
+from djitellopySim import Tello, set_simulation
+
+# runs a worker process does before it is replaced, which frees the threads
+# of the swarms those runs created; Python 3.11 and later
+RUNS_PER_WORKER = 25
+
+
+class Separation:
+    """Recorder of the closest any two flying drones came during a run,
+    however far apart that is. The collision detector only measures pairs
+    within its near miss distance.
+
+    Each step only looks for pairs closer than the closest so far, so the
+    search narrows as the run goes on.
+    """
+
+    def __init__(self):
+        self.min = np.inf
+
+    def record(self, state, t):
+        flying = np.flatnonzero(state.flying[:state.count])
+        if len(flying) < 2 or self.min <= 0:
+            return
+        points = state.pos[flying] * (1, 1, 100)
+        if np.isinf(self.min):
+            diff = points[:, None] - points[None]
+            gaps = np.sqrt(np.einsum("ijk,ijk->ij", diff, diff))
+            gaps[np.diag_indices(len(points))] = np.inf
+        else:
+            _, _, gaps = close_pairs(points, self.min)
+        if len(gaps):
+            self.min = min(self.min, float(gaps.min()))
+
+
+def simulate(script, seed=None, wind=True, latency=True):
+    """Fly `script` once in a fresh headless simulation and return what
+    happened.
+
+    Arguments:
+        script: path of a Python script, or a function taking no arguments
+        seed: seed for the wind and latency
+        wind, latency: False for a calm, instant run
+    """
+    simulation = sim(clock="fast", headless=True, seed=seed)
+    if not wind:
+        simulation.wind = 0
+    simulation.latency = latency
+    separation = Separation()
+    simulation.recorders.append(separation)
+    commands = []
+    simulation.command_listeners.append(lambda t, i, text: commands.append((t, i, text)))
+    set_simulation(simulation)
+
+    start = simulation.clock.now()
+    error = None
+    try:
+        with redirect_stdout(io.StringIO()):
+            if isinstance(script, str):
+                runpy.run_path(script, run_name="__main__")
+            else:
+                script()
+    except Exception as e:
+        error = repr(e)
+    finally:
+        end = simulation.clock.now()
+        simulation.quit()
+
+    n = simulation.state.count
+    times = [[] for _ in range(n)]
+    for t, i, _ in sorted(commands):
+        times[i].append(t - start)
+    collisions = simulation.collisions
+    return {
+        "seed": seed,
+        "error": error,
+        "duration": end - start,
+        "final": simulation.state.pos[:n] * (1, 1, 100),
+        "command_times": times,
+        "collisions": collisions.collisions,
+        "near_misses": collisions.near_misses,
+        # None if fewer than two drones were ever flying together
+        "min_separation": separation.min if np.isfinite(separation.min) else None,
+    }
+
+
+def compare(run, reference):
+    """Final position error and timing slip of `run` against `reference`."""
+    metrics = {
+        "seed": run["seed"],
+        "error": run["error"],
+        "duration": run["duration"],
+        "collisions": run["collisions"],
+        "near_misses": run["near_misses"],
+        "min_separation": run["min_separation"],
+    }
+    final, expected = run["final"], reference["final"]
+    if final.shape == expected.shape and len(final):
+        errors = np.linalg.norm(final - expected, axis=1)
+        metrics["final_error_max"] = float(errors.max())
+        metrics["final_error_mean"] = float(errors.mean())
+
+    # how late each drone's k-th command was sent compared with the reference
+    slips = [
+        t - t_ref
+        for times, ref_times in zip(run["command_times"], reference["command_times"])
+        for t, t_ref in zip(times, ref_times)
+    ]
+    if slips:
+        metrics["slip_max"] = float(np.max(np.abs(slips)))
+    metrics["slip_end"] = run["duration"] - reference["duration"]
+    return metrics
+
+
+def _job(args):
+    script, seed, reference = args
+    Tello.LOGGER.setLevel("WARNING")
+    return compare(simulate(script, seed), reference)
+
+
+def distribution(values):
+    values = np.asarray([v for v in values if v is not None and np.isfinite(v)], dtype=float)
+    if not len(values):
+        return None
+    p5, p50, p95 = np.percentile(values, (5, 50, 95))
+    return {
+        "count": len(values),
+        "min": float(values.min()),
+        "p5": float(p5),
+        "p50": float(p50),
+        "p95": float(p95),
+        "max": float(values.max()),
+        "mean": float(values.mean()),
+    }
+
+
+def report(script, runs, reference):
+    """Summarise the metrics of many runs."""
+    ok = [run for run in runs if run["error"] is None]
+    return {
+        "script": script if isinstance(script, str) else getattr(script, "__name__", repr(script)),
+        "runs": len(runs),
+        "failures": [{"seed": run["seed"], "error": run["error"]} for run in runs if run["error"]],
+        "reference_duration": reference["duration"],
+        "runs_with_collisions": sum(1 for run in ok if run["collisions"]),
+        "runs_with_near_misses": sum(1 for run in ok if run["near_misses"]),
+        "collisions": distribution(run["collisions"] for run in ok),
+        # the closest each run's drones came, near miss or not
+        "min_separation": distribution(run["min_separation"] for run in ok),
+        "runs_without_separation": sum(1 for run in ok if run["min_separation"] is None),
+        "final_error_max": distribution(run.get("final_error_max") for run in ok),
+        "final_error_mean": distribution(run.get("final_error_mean") for run in ok),
+        "slip_max": distribution(run.get("slip_max") for run in ok),
+        "slip_end": distribution(run["slip_end"] for run in ok),
+        "duration": distribution(run["duration"] for run in ok),
+    }
+
+
+def run(script, runs=100, seed=0, workers=None):
+    """Fly `script` `runs` times with seeds `seed`, `seed + 1`, ... across
+    `workers` processes and return the report.
+
+    ```python
+    print(run('testSwarm2.py', runs=1000)["min_separation"])
+    ```
+    """
+    Tello.LOGGER.setLevel("WARNING")
+    reference = simulate(script, seed, wind=False, latency=False)
+    if reference["error"]:
+        raise RuntimeError("The reference run failed: {}".format(reference["error"]))
+
+    jobs = [(script, seed + k, reference) for k in range(runs)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = list(map(_job, jobs))
+    else:
+        options = {}
+        if sys.version_info >= (3, 11):
+            options["max_tasks_per_child"] = RUNS_PER_WORKER
+        with ProcessPoolExecutor(workers, **options) as pool:
+            results = list(pool.map(_job, jobs, chunksize=max(1, min(RUNS_PER_WORKER, runs // (workers * 4)))))
+    return report(script, results, reference)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fly a script under many wind and latency seeds.")
+    parser.add_argument("script", help="choreography script to fly")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first run")
+    parser.add_argument("--workers", type=int, help="processes to use, one per CPU by default")
+    parser.add_argument("--output", default="montecarlo.json")
+    args = parser.parse_args()
+
+    summary = run(os.path.abspath(args.script), args.runs, args.seed, args.workers)
+    with open(args.output, "w") as fd:
+        json.dump(summary, fd, indent=2)
+    print(json.dumps({key: summary[key] for key in (
+        "runs", "runs_with_collisions", "min_separation", "final_error_max", "slip_max",
+    )}, indent=2), file=sys.stderr)
@@ -1,117 +1,1388 @@
-import pygame
+import os
+import time
+import heapq
+import asyncio
+import itertools
 import threading
-from random import uniform
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import lru_cache
+from math import ceil
+import random
+
+import numpy as np
+
+from collisionDetector import CollisionDetector
+from profiler import Profiler
+from frameScheduler import FrameScheduler
+from matrixLed import MatrixDisplay, MATRIX_SCALE
 
 SHOW_TRAILS = False
 GRID = 0
 
-class sim:
+# points kept per trail (0 keeps them all) and alpha faded out per second
+TRAIL_LENGTH = 2000
+TRAIL_FADE = 0
+TRAIL_COLOURS = [
+    (200, 200, 200), (230, 80, 80), (80, 200, 90), (90, 140, 240),
+    (240, 200, 60), (200, 90, 220), (60, 210, 210), (250, 140, 50),
+]
 
-    def __init__(self):
-        # Initialize Pygame
+# fixed rate the physics thread steps every drone at
+PHYSICS_HZ = 120
+# most steps the physics thread runs per hold of the lock; a clock running
+# faster than the physics can keep up with is held back to match, instead of
+# the catch-up locking the drones' commands out
+MAX_CATCHUP_STEPS = 12
+# frames per second the window is drawn at
+FPS = 60
+# draw fewer frames, then drop the trails, when frames cost more than that
+DEGRADE_FRAMES = False
+# strength of the random wind that pushes flying drones around
+WIND = 0.3
+
+# run physics and state only, without pygame or a window
+HEADLESS = os.environ.get("TELLO_SIM_HEADLESS", "") not in ("", "0")
+
+# state snapshots published per second for the getters and the UDP server
+TELEMETRY_HZ = 20
+# flight time a full battery lasts, in seconds
+BATTERY_LIFE = 780
+
+# colour of the grid lines
+GRID_COLOUR = (100, 100, 100)
+# changed areas of the window pushed to the display one by one; beyond this
+# many the whole window is redrawn instead
+MAX_DIRTY_RECTS = 256
+
+# number of pre-transformed drone sprites kept by the render loop
+SPRITE_CACHE_SIZE = 1024
+
+IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tello.png")
+
+# "realtime", "fast" or a speed-up factor such as "50"
+CLOCK = os.environ.get("TELLO_SIM_CLOCK", "realtime")
+
+# the event-driven clocks the current thread or task takes part in
+_PARTICIPATING = ContextVar("participating", default=())
+
+# imported on first use so headless simulations never pay for it
+pygame = None
+
+
+def _load_pygame():
+    global pygame
+    if pygame is None:
+        import pygame as _pygame
+        pygame = _pygame
+    return pygame
+
+
+@lru_cache(maxsize=1)
+def _repaint_events():
+    # events after which the window has to be drawn again in full; the
+    # WINDOW* ones only exist in newer pygame versions
+    return {getattr(pygame, name) for name in (
+        "VIDEOEXPOSE", "WINDOWEXPOSED", "WINDOWSHOWN", "WINDOWRESTORED",
+    ) if hasattr(pygame, name)}
+
+
+# simulations with a window open; pygame is shut down when the last closes
+_windows = 0
+_windows_lock = threading.Lock()
+
+
+def _open_window():
+    global _windows
+    with _windows_lock:
+        if _windows:
+            # pygame has a single display, which a second window would take over
+            raise RuntimeError("Only one simulation per process can have a window, "
+                               "create the others with headless=True")
+        _load_pygame()
         pygame.init()
+        _windows += 1
+
+
+def _close_window():
+    global _windows
+    with _windows_lock:
+        _windows -= 1
+        if not _windows:
+            pygame.quit()
+
+
+class RealTimeClock:
+    """Simulation clock that follows the wall clock."""
+
+    scale = 1.0
+    # event-driven clocks advance the physics themselves through `listeners`
+    event_driven = False
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        # the clock stops here until the physics catches up, see `hold`
+        self._limit = float("inf")
+
+    def now(self):
+        """Seconds of simulated time since the clock was created."""
+        return min((time.perf_counter() - self._origin) * self.scale, self._limit)
+
+    def sleep(self, seconds):
+        """Block the calling thread for `seconds` of simulated time."""
+        wake = self.now() + seconds
+        if seconds > 0:
+            time.sleep(seconds / self.scale)
+        # the clock can be held back meanwhile, so sleep on until it reads the wake time
+        left = wake - self.now()
+        while left > 0:
+            time.sleep(max(left / self.scale, 0.001))
+            left = wake - self.now()
+
+    async def sleep_async(self, seconds):
+        """Suspend the calling coroutine for `seconds` of simulated time."""
+        wake = self.now() + seconds
+        await asyncio.sleep(max(seconds, 0) / self.scale)
+        left = wake - self.now()
+        while left > 0:
+            await asyncio.sleep(max(left / self.scale, 0.001))
+            left = wake - self.now()
+
+    def hold(self, t):
+        """Keep the clock from reading later than `t` until the next call,
+        for a simulation whose physics cannot keep up with it. Held time is
+        skipped rather than caught up, so the clock never jumps."""
+        # called from the physics thread only
+        ahead = (time.perf_counter() - self._origin) * self.scale - self._limit
+        if ahead > 0:
+            self._origin += ahead / self.scale
+        self._limit = t
+
+    def reserve(self, count=1):
+        """Announce `count` threads or tasks that are about to `participate`."""
+
+    def release(self, count=1):
+        """Take back `count` reservations that will never `participate`."""
+
+    @contextmanager
+    def participate(self, reserved=False):
+        """Mark the calling thread or task as driving the simulation."""
+        yield
+
+    @contextmanager
+    def idle(self):
+        """Mark the calling thread as blocked on something other than the clock."""
+        yield
+
+
+class ScaledClock(RealTimeClock):
+    """Simulation clock running `scale` times faster than the wall clock."""
+
+    def __init__(self, scale):
+        if scale <= 0:
+            raise ValueError("clock scale must be positive")
+        super().__init__()
+        self.scale = float(scale)
+
+
+class VirtualClock(RealTimeClock):
+    """Discrete-event clock. Simulated time only moves once every participating
+    thread is asleep, and then jumps straight to the earliest wake-up, so a
+    routine runs as fast as the CPU allows.
+
+    Threads and coroutines that sleep without calling `participate` count as
+    participants for the duration of that sleep.
+    """
+
+    scale = float("inf")
+    event_driven = True
+
+    def __init__(self):
+        self._now = 0.0
+        self._cond = threading.Condition()
+        self._active = 0
+        self._sleeping = 0
+        self._wakeups = []
+        # coroutines waiting in sleep_async, as (wake, seq, loop, future)
+        self._futures = []
+        self._seq = itertools.count()
+        # called with the new time whenever the clock jumps forward
+        self.listeners = []
+
+    def now(self):
+        return self._now
+
+    def hold(self, t):
+        # time only moves when the physics has been stepped to it
+        pass
+
+    def sleep(self, seconds):
+        if seconds <= 0:
+            return
+        with self._cond:
+            implicit = self not in _PARTICIPATING.get()
+            if implicit:
+                self._active += 1
+            wake = self._now + seconds
+            heapq.heappush(self._wakeups, wake)
+            self._sleeping += 1
+            self._advance()
+            while self._now < wake:
+                self._cond.wait()
+            if implicit:
+                self._active -= 1
+                self._advance()
+
+    async def sleep_async(self, seconds):
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            implicit = self not in _PARTICIPATING.get()
+            if implicit:
+                self._active += 1
+            wake = self._now + seconds
+            heapq.heappush(self._wakeups, wake)
+            heapq.heappush(self._futures, (wake, next(self._seq), loop, future))
+            self._sleeping += 1
+            self._advance()
+        await future
+        if implicit:
+            with self._cond:
+                self._active -= 1
+                self._advance()
+
+    def reserve(self, count=1):
+        with self._cond:
+            self._active += count
+
+    def release(self, count=1):
+        with self._cond:
+            self._active -= count
+            self._advance()
+
+    @contextmanager
+    def participate(self, reserved=False):
+        clocks = _PARTICIPATING.get()
+        if self in clocks:
+            yield
+            return
+        if not reserved:
+            self.reserve()
+        token = _PARTICIPATING.set(clocks + (self,))
+        try:
+            yield
+        finally:
+            _PARTICIPATING.reset(token)
+            with self._cond:
+                self._active -= 1
+                self._advance()
+
+    @contextmanager
+    def idle(self):
+        if self not in _PARTICIPATING.get():
+            yield
+            return
+        with self._cond:
+            self._active -= 1
+            self._advance()
+        try:
+            yield
+        finally:
+            self.reserve()
+
+    def _advance(self):
+        # caller holds self._cond
+        if not self._wakeups or self._sleeping < self._active:
+            return
+        self._now = max(self._now, self._wakeups[0])
+        for listener in self.listeners:
+            listener(self._now)
+        while self._wakeups and self._wakeups[0] <= self._now:
+            heapq.heappop(self._wakeups)
+            self._sleeping -= 1
+        while self._futures and self._futures[0][0] <= self._now:
+            _, _, loop, future = heapq.heappop(self._futures)
+            loop.call_soon_threadsafe(_resolve, future)
+        self._cond.notify_all()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def make_clock(spec="realtime"):
+    """Build a clock from a short description: "realtime", "fast" (as fast as
+    possible) or a speed-up factor such as 50 or "50x"."""
+    if isinstance(spec, RealTimeClock):
+        return spec
+    if isinstance(spec, (int, float)):
+        return RealTimeClock() if spec == 1 else ScaledClock(spec)
+    spec = spec.strip().lower()
+    if spec in ("", "realtime", "real"):
+        return RealTimeClock()
+    if spec in ("fast", "virtual"):
+        return VirtualClock()
+    return make_clock(float(spec.rstrip("x")))
+
+
+class SwarmState:
+    """State of every drone in a simulation, stored as one contiguous NumPy
+    array per field so the physics and render loops can work on the whole
+    swarm at once. Row `i` belongs to the `i`-th registered drone.
+    """
+
+    FIELDS = {
+        "pos": ((3,), float),
+        "rot": ((), float),
+        # motion still to cover, and the rate to cover it at, per second
+        "travel": ((3,), float),
+        "vel": ((3,), float),
+        "turn": ((), float),
+        "spin": ((), float),
+        # latest rc stick setpoint (left/right, forward/back, up/down, yaw), -100 to 100
+        "rc": ((4,), float),
+        # state before the last physics step, for render interpolation
+        "last_pos": ((3,), float),
+        "last_rot": ((), float),
+        "flip": ((), float),
+        "led": ((3,), np.uint8),
+        # what the matrix LED shows, an id from `MatrixDisplay`, and since when
+        "mled": ((), np.int32),
+        "mled_start": ((), float),
+        "scl": ((), float),
+        "speed": ((), float),
+        "flying": ((), bool),
+        "windy": ((), bool),
+        # seconds spent flying, which also drains the battery
+        "flight_time": ((), float),
+    }
+
+    def __init__(self, capacity=16):
+        self.count = 0
+        for name, (shape, dtype) in self.FIELDS.items():
+            setattr(self, name, np.zeros((capacity,) + shape, dtype=dtype))
+
+    def add(self):
+        """Reserve a row for a new drone, growing the arrays if needed, and
+        return its index."""
+        capacity = len(self.pos)
+        if self.count == capacity:
+            for name in self.FIELDS:
+                old = getattr(self, name)
+                new = np.zeros((capacity * 2,) + old.shape[1:], dtype=old.dtype)
+                new[:capacity] = old
+                setattr(self, name, new)
+        self.count += 1
+        return self.count - 1
+
+
+class DroneState:
+    """Dict-like view of one drone's row in a `SwarmState`.
+
+    `drone["pos"]` is a live view, so `drone["pos"][0] += 10` updates the
+    swarm arrays in place; scalar fields read back as floats and `led` as a
+    tuple of ints. Assignments such as `drone["pos"] = ...` hold `lock`, so
+    they never land halfway through a physics step.
+    """
+
+    __slots__ = ("state", "index", "lock")
+
+    def __init__(self, state, index, lock=None):
+        self.state = state
+        self.index = index
+        self.lock = lock if lock is not None else nullcontext()
+
+    def __getitem__(self, key):
+        value = getattr(self.state, key)[self.index]
+        if key == "led":
+            return tuple(value.tolist())
+        if value.ndim:
+            return value
+        return value.item()
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            getattr(self.state, key)[self.index] = value
+            # a direct assignment is a jump, not something to interpolate across
+            if key in ("pos", "rot"):
+                getattr(self.state, "last_" + key)[self.index] = value
+
+    def __contains__(self, key):
+        return key in SwarmState.FIELDS
+
+    def __iter__(self):
+        return iter(SwarmState.FIELDS)
+
+    def keys(self):
+        return SwarmState.FIELDS.keys()
+
+    def __repr__(self):
+        return repr({key: self[key] for key in self})
+
+
+class Snapshot:
+    """Copy of everything needed to draw the swarm, taken at the end of a
+    physics tick. A snapshot is never changed once published: the physics
+    thread publishes a new one by swapping a single reference, so the render
+    loop reads a whole tick however long it takes to draw, without a lock.
+    """
+
+    FIELDS = ("last_pos", "pos", "last_rot", "rot", "flip", "scl", "led", "mled", "mled_start")
+
+    def __init__(self, state, t):
+        self.t = t
+        self.count = n = state.count
+        for name in self.FIELDS:
+            setattr(self, name, getattr(state, name)[:n].copy())
+
+    def interpolate(self, now, dt):
+        """Positions and rotations blended between the last two physics
+        steps for time `now`, so motion looks smooth at any frame rate."""
+        alpha = min(max((now - self.t) / dt, 0.0), 1.0)
+        pos = self.last_pos + (self.pos - self.last_pos) * alpha
+        rot = self.last_rot + (self.rot - self.last_rot) * alpha
+        return pos, rot
+
+    def still(self):
+        """True if nothing was moving at this tick."""
+        return np.array_equal(self.pos, self.last_pos) and np.array_equal(self.rot, self.last_rot)
+
+    def same(self, other):
+        """True if this snapshot draws the same as `other`."""
+        return self.count == other.count and all(
+            np.array_equal(getattr(self, name), getattr(other, name)) for name in self.FIELDS
+        )
+
+
+class TelemetryFrame:
+    """One published telemetry snapshot: a row of `Telemetry.FIELDS` values
+    and a ready-to-send SDK state string per drone."""
+
+    def __init__(self, capacity=16):
+        self.t = 0.0
+        self.count = 0
+        self.values = np.zeros((capacity, len(Telemetry.FIELDS)))
+        self.packets = []
+
+
+class Telemetry:
+    """Telemetry snapshots of the whole swarm, as the real drone streams them.
+
+    The physics thread fills the back of two frames and then swaps it to the
+    front with a single assignment, so readers never take a lock: they read
+    `front`, which stays whole until two more frames have been published.
+    """
+
+    FIELDS = (
+        "mid", "x", "y", "z", "pitch", "roll", "yaw", "vgx", "vgy", "vgz",
+        "templ", "temph", "tof", "h", "bat", "baro", "time", "agx", "agy", "agz",
+    )
+    FLOAT_FIELDS = ("baro", "agx", "agy", "agz")
+    PACKET = (
+        "mid:%d;x:%d;y:%d;z:%d;mpry:0,0,0;pitch:%d;roll:%d;yaw:%d;"
+        "vgx:%d;vgy:%d;vgz:%d;templ:%d;temph:%d;tof:%d;h:%d;bat:%d;"
+        "baro:%.2f;time:%d;agx:%.2f;agy:%.2f;agz:%.2f;\r\n"
+    )
+    COLUMN = {field: i for i, field in enumerate(FIELDS)}
+
+    def __init__(self, rate=TELEMETRY_HZ):
+        self.rate = rate
+        self._back = TelemetryFrame()
+        self.front = TelemetryFrame()
+        # positions and velocities at the last publish, for the derivatives
+        self._t = None
+        self._pos = None
+        self._vel = None
+
+    def publish(self, state, t):
+        """Snapshot `state` at simulated time `t` and make it the front frame."""
+        # positions in cm: pixels across the screen, metres above the floor
+        n = state.count
+        pos = state.pos[:n] * (1, 1, 100)
+        vel = np.zeros((n, 3))
+        acc = np.zeros((n, 3))
+        if self._t is not None and t > self._t and len(self._pos) == n:
+            vel = (pos - self._pos) / (t - self._t)
+            acc = (vel - self._vel) / (t - self._t)
+        self._t, self._pos, self._vel = t, pos, vel
+
+        frame = self._back
+        self._fill(frame, state, t, vel, acc)
+        self._back, self.front = self.front, frame
+
+    def _fill(self, frame, state, t, vel, acc):
+        n = state.count
+        if len(frame.values) < n:
+            frame.values = np.zeros((len(state.pos), len(self.FIELDS)))
+
+        pos = state.pos[:n] * (1, 1, 100)
+        height = np.round(pos[:, 2] - 100)
+        values = frame.values[:n]
+        values[:] = 0
+        column = self.COLUMN
+        values[:, column["mid"]] = -1
+        values[:, column["yaw"]] = (180 - state.rot[:n]) % 360 - 180
+        # the SDK reports speeds in dm/s and acceleration in thousandths of g
+        values[:, column["vgx"]:column["vgz"] + 1] = np.trunc(vel / 10)
+        values[:, column["templ"]] = 60
+        values[:, column["temph"]] = 62
+        values[:, column["tof"]] = height + 10
+        values[:, column["h"]] = height
+        values[:, column["bat"]] = np.clip(
+            np.ceil(100 - state.flight_time[:n] * 100 / BATTERY_LIFE), 0, 100
+        )
+        values[:, column["baro"]] = pos[:, 2] - 100
+        values[:, column["time"]] = np.trunc(state.flight_time[:n])
+        values[:, column["agx"]:column["agz"] + 1] = acc * 1000 / 981
+        values[:, column["agz"]] -= 1000
+
+        frame.packets = [self.PACKET % row for row in map(tuple, values.tolist())]
+        frame.t = t
+        frame.count = n
+
+    def frame(self, state, index):
+        """The front frame, or a fresh one from `state` if `index` has not been
+        published yet."""
+        frame = self.front
+        if index >= frame.count:
+            still = np.zeros((state.count, 3))
+            t = frame.t
+            frame = TelemetryFrame(len(state.pos))
+            self._fill(frame, state, t, still, still)
+        return frame
 
-        # Set up the display
+    def get(self, state, index, field):
+        """Latest value of `field` for drone `index`."""
+        value = self.frame(state, index).values[index, self.COLUMN[field]]
+        return float(value) if field in self.FLOAT_FIELDS else int(value)
+
+    def packet(self, state, index):
+        """Latest SDK state string for drone `index`."""
+        return self.frame(state, index).packets[index]
+
+
+class SpriteCache:
+    """Bounded LRU cache of scaled, flipped and rotated copies of the drone
+    sprite, so the render loop only resamples the image when a drone's
+    apparent size, heading or flip phase actually changes.
+
+    Sprites are keyed by their width in pixels, their rotation rounded to
+    `angle_step` degrees and the whole frame of the flip animation.
+    """
+
+    def __init__(self, image, capacity=SPRITE_CACHE_SIZE, angle_step=1):
+        self.image = image
+        self.capacity = capacity
+        self.angle_step = angle_step
+        self.hits = 0
+        self.misses = 0
+        self._sprites = OrderedDict()
+
+    def get(self, scale, rotation, flip=0):
+        """Return the sprite drawn at `scale` times the image size, rotated by
+        `rotation` degrees and `flip` frames from the end of a flip."""
+        width = int(scale * self.image.get_width())
+        height = int(scale * self.image.get_height())
+        angle = round(rotation / self.angle_step) % round(360 / self.angle_step)
+        phase = ceil(flip) if flip > 0 else 0
+        key = (width, height, angle, phase)
+
+        sprite = self._sprites.get(key)
+        if sprite is not None:
+            self.hits += 1
+            self._sprites.move_to_end(key)
+            return sprite
+
+        self.misses += 1
+        sprite = pygame.transform.scale(self.image, (width, height))
+        if phase:
+            sprite = pygame.transform.scale(
+                sprite, (int(width * abs(phase - 12) / 12), height)
+            )
+        sprite = pygame.transform.rotate(sprite, angle * self.angle_step)
+
+        self._sprites[key] = sprite
+        if len(self._sprites) > self.capacity:
+            self._sprites.popitem(last=False)
+        return sprite
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._sprites),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        self._sprites.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class TrailLayer:
+    """Persistent off-screen surface the flight trails are drawn onto. Every
+    frame only the newest segment of each trail is added, so drawing trails
+    costs the same at the end of a long show as at the start.
+
+    Trails older than `max_length` points are dropped in batches by redrawing
+    the layer, and `fade` removes that much alpha from the layer per second.
+    """
+
+    def __init__(self, size, max_length=TRAIL_LENGTH, fade=TRAIL_FADE, colours=TRAIL_COLOURS):
+        self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        self.max_length = max_length
+        self.fade = fade
+        self.colours = colours
+        self._trails = {}
+        self._dropped = 0
+        self._faded = 0.0
+        self._last = None
+        self._cleared = False
+
+    def colour(self, tello, index):
+        """Trail colour of `tello`: its `trail_colour` if set, else one from the palette."""
+        colour = getattr(tello, "trail_colour", None)
+        return colour if colour is not None else self.colours[index % len(self.colours)]
+
+    def add(self, tello, colour, x, y, now):
+        """Extend the trail of `tello` to (x, y) and return the area drawn, if any."""
+        trail = self._trails.get(tello)
+        if trail is None:
+            trail = self._trails[tello] = (colour, deque(maxlen=self.max_length or None))
+        points = trail[1]
+        if points:
+            last_x, last_y, _ = points[-1]
+            if abs(x - last_x) < 1 and abs(y - last_y) < 1:
+                return None
+            area = pygame.draw.line(self.surface, colour, (last_x, last_y), (x, y), 2)
+            if len(points) == points.maxlen:
+                self._dropped += 1
+            points.append((x, y, now))
+            return area
+        points.append((x, y, now))
+        return None
+
+    def update(self, now):
+        """Fade the layer and drop expired segments once enough have built up.
+        Returns True if that changed the whole layer."""
+        changed = self._cleared
+        self._cleared = False
+        if self._last is not None and self.fade:
+            self._faded += self.fade * (now - self._last)
+            if self._faded >= 1:
+                amount = min(int(self._faded), 255)
+                self._faded -= int(self._faded)
+                self.surface.fill((0, 0, 0, amount), special_flags=pygame.BLEND_RGBA_SUB)
+                changed = True
+        self._last = now
+
+        if self.max_length and self._dropped >= max(self.max_length // 4, 1):
+            self.redraw(now)
+            changed = True
+        return changed
+
+    def redraw(self, now):
+        self._dropped = 0
+        self.surface.fill((0, 0, 0, 0))
+        for colour, points in self._trails.values():
+            previous = None
+            for x, y, t in points:
+                if previous is not None:
+                    alpha = 255 - self.fade * (now - t)
+                    if alpha >= 1:
+                        pygame.draw.line(self.surface, (*colour, int(alpha)), previous, (x, y), 2)
+                previous = (x, y)
+
+    def clear(self):
+        self._trails.clear()
+        self._dropped = 0
+        self._cleared = True
+        self.surface.fill((0, 0, 0, 0))
+
+
+def visible(pos, scl, sprite_size, screen_size):
+    """Indices of the drones at `pos`, drawn at `scl` times `sprite_size`,
+    whose sprite overlaps a screen of `screen_size`."""
+    x, y, z = pos.T
+    width, height = screen_size
+    # half the diagonal of the sprite, whatever its rotation
+    half = z * scl * max(sprite_size) * 0.71
+    return np.flatnonzero(
+        (x + half >= 0) & (x - half <= width) & (y + half >= 0) & (y - half <= height)
+    )
+
+
+def background(size, grid=None, scenery=None):
+    """The static layer every frame is drawn on: black, with the grid every
+    `grid` pixels and `scenery`, any surface such as a floor plan, on top.
+    Built once for each combination and then reused."""
+    grid = GRID if grid is None else grid
+    key = (tuple(size), grid, scenery)
+    surface = _BACKGROUNDS.get(key)
+    if surface is None:
+        surface = pygame.Surface(size)
+        surface.fill((0, 0, 0))
+        if grid:
+            width, height = size
+            for x in range(0, width, grid):
+                for y in range(0, height, grid):
+                    pygame.draw.rect(surface, GRID_COLOUR, pygame.Rect(x, y, grid, grid), 1)
+        if scenery is not None:
+            surface.blit(scenery, (0, 0))
+        if len(_BACKGROUNDS) >= 8:
+            _BACKGROUNDS.clear()
+        _BACKGROUNDS[key] = surface
+    return surface
+
+
+_BACKGROUNDS = {}
+
+
+def _drone_look(sprites, x, y, z, rot, flip, scl, matrix, pattern):
+    # the sprite of a drone at (x, y) and where it goes, the radius of its
+    # LED ring and its matrix surface and where that goes, if it has one
+    sprite = sprites.get(z * scl, rot, flip)
+    dest = (x - sprite.get_width() / 2, y - sprite.get_height() / 2)
+    radius = 10
+    panel = None
+    if pattern is not None:
+        size = max(int(z * scl * sprites.image.get_width() * MATRIX_SCALE), 8)
+        panel = (matrix.surface(pattern, size), (x - size / 2, y - size / 2))
+        # keep the LED ring round the matrix rather than over it
+        radius = max(radius, size * 0.71 + 5)
+    return sprite, dest, radius, panel
+
+
+def _paint_drone(screen, look, x, y, led):
+    sprite, dest, radius, panel = look
+    screen.blit(sprite, dest)
+    if panel is not None:
+        screen.blit(*panel)
+    pygame.draw.circle(screen, led, (x, y), radius, 5)
+
+
+def draw_swarm(screen, sprites, pos, rot, flip, scl, led, trails=None, owners=None, now=0.0,
+               grid=None, profiler=None, matrix=None, patterns=None, scenery=None):
+    """Draw one frame of a swarm onto `screen`: the background, the trails in
+    `trails` and each drone's sprite and LED. Used by offline exports and
+    benchmarks, and draws the same as the simulation window.
+
+    `owners` are the objects each drone's trail is kept under and coloured
+    by, the drone indices if not given. `patterns` are the matrix LED
+    patterns to draw from the `matrix` display, None for a drone without
+    one. An enabled `profiler` is given the time spent on each part of the
+    frame.
+    """
+    timing = profiler is not None and profiler.enabled
+    if timing:
+        clock = time.perf_counter
+        start = clock()
+
+    width, height = screen.get_size()
+    screen.blit(background((width, height), grid, scenery), (0, 0))
+    if timing:
+        profiler.add("frame.background", clock() - start)
+
+    positions = pos.tolist()
+    if trails is not None:
+        if timing:
+            mark = clock()
+        owners = range(len(positions)) if owners is None else owners
+        for i, owner in enumerate(owners):
+            trails.add(owner, trails.colour(owner, i), positions[i][0], positions[i][1], now)
+        trails.update(now)
+        screen.blit(trails.surface, (0, 0))
+        if timing:
+            profiler.add("frame.trails", clock() - mark)
+
+    rot = rot.tolist()
+    flip = flip.tolist()
+    scl_list = scl.tolist()
+    led = led.tolist()
+    transform = blit = 0.0
+    for i in visible(pos, scl, sprites.image.get_size(), (width, height)).tolist():
+        x, y, z = positions[i]
+        if timing:
+            mark = clock()
+        look = _drone_look(sprites, x, y, z, rot[i], flip[i], scl_list[i], matrix,
+                           None if patterns is None else patterns[i])
+        if timing:
+            transform -= mark - clock()
+            mark = clock()
+        _paint_drone(screen, look, x, y, led[i])
+        if timing:
+            blit -= mark - clock()
+
+    if timing:
+        profiler.add("frame.transform", transform)
+        profiler.add("frame.blit", blit)
+
+
+class DirtyRenderer:
+    """Draws the simulation window by redrawing only what changed since the
+    last frame.
+
+    The grid and scenery come from the cached `background`. Each frame the
+    areas drones left or moved into, and the newest trail segments, are
+    restored from the background and the trail layer, the drones touching
+    them are drawn again and just those rectangles need pushing with
+    `pygame.display.update`. Drones that look the same as last frame cost
+    nothing. The whole frame is redrawn when the background changes, the
+    trail layer fades, `full` is set, or more than `max_rects` areas or more
+    than a window's worth of area changed.
+    """
+
+    def __init__(self, screen, sprites, max_rects=MAX_DIRTY_RECTS):
+        self.screen = screen
+        self.sprites = sprites
+        self.max_rects = max_rects
+        # redraw the whole window on the next frame
+        self.full = True
+        self._background = None
+        self._trails = None
+        # what each drone looked like last frame, and the area it covered
+        self._drawn = {}
+
+    def draw(self, pos, rot, flip, scl, led, trails=None, owners=None, now=0.0, grid=None,
+             scenery=None, matrix=None, patterns=None, restore=(), profiler=None):
+        """Draw a frame. Returns the rectangles that changed, or None when the
+        whole window was redrawn and needs a flip. `restore` are more areas
+        to repaint, such as where an overlay was drawn last frame."""
+        timing = profiler is not None and profiler.enabled
+        if timing:
+            clock = time.perf_counter
+            start = clock()
+
+        screen = self.screen
+        width, height = screen.get_size()
+        layer = background((width, height), grid, scenery)
+        if layer is not self._background or trails is not self._trails:
+            self._background = layer
+            self._trails = trails
+            self.full = True
+
+        positions = pos.tolist()
+        dirty = list(restore)
+        if trails is not None:
+            owners = range(len(positions)) if owners is None else owners
+            for i, owner in enumerate(owners):
+                segment = trails.add(owner, trails.colour(owner, i), positions[i][0], positions[i][1], now)
+                if segment is not None:
+                    dirty.append(segment.inflate(2, 2))
+            if trails.update(now):
+                self.full = True
+
+        rot = rot.tolist()
+        flip = flip.tolist()
+        scl_list = scl.tolist()
+        led = led.tolist()
+        previous = self._drawn
+        drawn = {}
+        looks = []
+        for i in visible(pos, scl, self.sprites.image.get_size(), (width, height)).tolist():
+            x, y, z = positions[i]
+            look = _drone_look(self.sprites, x, y, z, rot[i], flip[i], scl_list[i], matrix,
+                               None if patterns is None else patterns[i])
+            sprite, dest, radius, panel = look
+            rect = pygame.Rect(dest, sprite.get_size()).union(
+                pygame.Rect(x - radius, y - radius, radius * 2, radius * 2)
+            ).inflate(2, 2)
+            key = (sprite, panel and panel[0], led[i], radius,
+                   int(dest[0]), int(dest[1]), int(x), int(y))
+            drawn[i] = (key, rect)
+            looks.append((i, look, rect, x, y))
+
+            last = previous.pop(i, None)
+            if last is None:
+                dirty.append(rect)
+            elif last[0] != key:
+                if rect.colliderect(last[1]):
+                    dirty.append(rect.union(last[1]))
+                else:
+                    dirty.append(rect)
+                    dirty.append(last[1])
+        # drones that have left the screen
+        dirty.extend(rect for _, rect in previous.values())
+        self._drawn = drawn
+        if timing:
+            mark = clock()
+            profiler.add("frame.transform", mark - start)
+            profiler.gauge("frame.dirty_rects", len(dirty))
+
+        if (self.full or len(dirty) > self.max_rects
+                # repainting overlapping areas costs more than one whole frame
+                or sum(rect.w * rect.h for rect in dirty) > width * height):
+            self.full = False
+            screen.blit(layer, (0, 0))
+            if trails is not None:
+                screen.blit(trails.surface, (0, 0))
+            for i, look, rect, x, y in looks:
+                _paint_drone(screen, look, x, y, led[i])
+            dirty = None
+        elif dirty:
+            # blitting an area off the edge of a surface would shift it
+            bounds = screen.get_rect()
+            dirty = [rect.clip(bounds) for rect in dirty]
+            areas = [look[2] for look in looks]
+            for rect in dirty:
+                # repaint the area and, in drawing order, the drones over it,
+                # clipped so drones round it are left as they are
+                screen.set_clip(rect)
+                screen.blit(layer, rect, rect)
+                if trails is not None:
+                    screen.blit(trails.surface, rect, rect)
+                for k in rect.collidelistall(areas):
+                    i, look, _, x, y = looks[k]
+                    _paint_drone(screen, look, x, y, led[i])
+            screen.set_clip(None)
+
+        if timing:
+            profiler.add("frame.blit", clock() - mark)
+        return dirty
+
+
+class sim:
+
+    def __init__(self, clock=None, headless=None, physics_hz=PHYSICS_HZ, seed=None, fps=FPS):
         self.width = 1000
         self.height = 1000
         self.running = True
         self.i = 0
-        self.screen = pygame.display.set_mode((self.width, self.height))
+        self.headless = HEADLESS if headless is None else headless
         self.tellos = []
-        self.image = pygame.image.load("tello.png")
-        pygame.display.set_caption("Tello Simulation")
-        self.update_thread = threading.Thread(target=self.update_visual)
-        self.update_thread.start()
+        self.state = SwarmState()
+        # held while the swarm arrays are resized, stepped or given new motion
+        self.lock = threading.Lock()
+        # notified after every batch of physics steps
+        self.stepped = threading.Condition()
+        self.dt = 1 / physics_hz
+        # wind and latency draw from here, so a seed makes a run repeatable
+        self.random = random.Random(seed)
+        self.wind = WIND
+        # what the window draws, from the module defaults
+        self.show_trails = SHOW_TRAILS
+        self.grid = GRID
+        # False turns off command latency for every drone
+        self.latency = True
+        self.telemetry = Telemetry()
+        self.matrix = MatrixDisplay()
+        self.collisions = CollisionDetector()
+        self.profiler = Profiler()
+        # paces the window, see `frames.stats()` for the frame rate
+        self.frames = FrameScheduler(fps, degrade=DEGRADE_FRAMES)
+        # objects with a record(state, t) method, called after every physics step
+        self.recorders = []
+        # functions called with (t, index, command) for each command a drone is sent
+        self.command_listeners = []
+        # motions still to fly, by drone, once its current one is done
+        self._paths = {}
+        # drones that stop flying once they touch down, see `set_motions`
+        self._landing = set()
+        self.clock = make_clock(CLOCK if clock is None else clock)
+        # what the render loop draws, republished by the physics thread every
+        # tick while `publish_snapshots` is set
+        self.publish_snapshots = not self.headless
+        self.snapshot = Snapshot(self.state, self.physics_time)
+        self.screen = None
+        self.image = None
+        self.sprites = None
+        self.trails = None
+        self.renderer = None
+        # surface drawn over the grid under the drones, such as a floor plan
+        self.scenery = None
+        # where the profiler overlay was drawn last frame
+        self._overlay = []
+        self._drawn_snapshot = None
+        # the grid, scenery and trails the last frame was drawn with
+        self._drawn_settings = None
+
+        if not self.headless:
+            # Initialize Pygame
+            _open_window()
+
+            # Set up the display
+            self.screen = pygame.display.set_mode((self.width, self.height))
+            self.image = pygame.image.load(IMAGE_PATH).convert_alpha()
+            self.sprites = SpriteCache(self.image)
+            self.trails = TrailLayer((self.width, self.height))
+            self.renderer = DirtyRenderer(self.screen, self.sprites)
+            pygame.display.set_caption("Tello Simulation")
+
+        self.physics_thread = threading.Thread(target=self.update_physics, daemon=True)
+        self.physics_thread.start()
+
+        # the window keeps the interpreter alive until it is closed
+        self.update_thread = None
+        if not self.headless:
+            self.update_thread = threading.Thread(target=self.update_visual)
+            self.update_thread.start()
+
+    @property
+    def clock(self):
+        return self._clock
+
+    @clock.setter
+    def clock(self, clock):
+        # physics time restarts from the new clock's current time
+        old = getattr(self, "_clock", None)
+        if old is not None and old.event_driven:
+            old.listeners.remove(self.advance_to)
+        with self.lock:
+            self._clock = clock
+            self._origin = clock.now()
+            self._ticks = 0
+            self._next_record = self._origin
+            self._next_telemetry = self._origin
+            self._wind = np.zeros(4)
+        if clock.event_driven:
+            clock.listeners.append(self.advance_to)
+
+    @property
+    def physics_time(self):
+        """Simulated time the physics has been stepped up to."""
+        return self._origin + self._ticks * self.dt
 
     def event_loop(self):
         # Handle events
-        for _ in pygame.event.get():
-            pass
+        if self.headless:
+            return
+        for event in pygame.event.get():
+            if event.type in _repaint_events():
+                # the window lost what was drawn on it
+                self.renderer.full = True
 
     def register(self, tello):
-        self.tellos.append(tello)
-    
+        """Add `tello` to the simulation and return its row in `self.state`."""
+        with self.lock:
+            index = self.state.add()
+            self.tellos.append(tello)
+        return index
+
+    def drone(self, index):
+        return DroneState(self.state, index, self.lock)
+
+    def take_snapshot(self):
+        """Publish and return a `Snapshot` of the swarm as it is now."""
+        with self.lock:
+            self.snapshot = Snapshot(self.state, self.physics_time)
+        return self.snapshot
+
     def quit(self):
+        # the update thread closes the window once its current frame is done
         self.running = False
-        pygame.quit()
+        for thread in (self.update_thread, self.physics_thread):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join()
+        # a clock shared with other simulations stops stepping this one
+        if self.clock.event_driven and self.advance_to in self.clock.listeners:
+            self.clock.listeners.remove(self.advance_to)
+
+    def close(self):
+        """Stop the simulation's threads and close its window, leaving pygame
+        running for any other simulation. Its state can still be read."""
+        self.quit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def set_motion(self, index, offset=(0, 0, 0), turn=0, duration=0.0):
+        """Have drone `index` move by `offset` and rotate by `turn` degrees
+        over `duration` seconds of simulated time. Returns immediately; the
+        physics thread carries the motion out."""
+        with self.lock:
+            self._paths.pop(index, None)
+            self._landing.discard(index)
+            self._start(index, offset, turn, duration)
+
+    def set_motions(self, index, path, landing=False):
+        """Have drone `index` fly each `(offset, turn, duration)` motion in
+        `path` in turn, e.g. the segments of a curve. Returns immediately.
+        With `landing`, the drone stops flying once the path is done."""
+        with self.lock:
+            if landing:
+                self._landing.add(index)
+            else:
+                self._landing.discard(index)
+            self._start(index, *path[0])
+            if len(path) > 1:
+                self._paths[index] = deque(path[1:])
+            else:
+                self._paths.pop(index, None)
+
+    def _start(self, index, offset, turn, duration):
+        duration = max(duration, self.dt)
+        state = self.state
+        state.travel[index] = offset
+        state.vel[index] = np.asarray(offset, dtype=float) / duration
+        state.turn[index] = turn
+        state.spin[index] = turn / duration
+
+    def _next_motions(self):
+        # start the next motion of each path whose last one has finished
+        state = self.state
+        for index, path in list(self._paths.items()):
+            if not (state.turn[index] or state.travel[index].any()):
+                self._start(index, *path.popleft())
+                if not path:
+                    del self._paths[index]
+
+    def _touch_down(self):
+        # landing drones stop flying on the step their path is done
+        for index in list(self._landing):
+            if not self.is_moving(index):
+                self.state.flying[index] = False
+                self._landing.discard(index)
 
-    def update_visual(self, windAmt=0.3):
+    def set_rc(self, index, sticks=(0, 0, 0, 0)):
+        """Set drone `index`'s rc sticks, each from -100 to 100. Only the
+        latest setpoint is kept, and the physics thread flies it each step
+        until it is changed, so a stream of rc commands never backs up."""
+        # a plain row write: no lock, so streaming drones never wait on the physics step
+        self.state.rc[index] = sticks
 
-        noise_x = 0
-        noise_y = 0
-        noise_z = 0
-        noise_t = 0
+    def command(self, index, text):
+        """Pass the command `text` sent to drone `index` to `command_listeners`."""
+        if self.command_listeners:
+            t = self.clock.now()
+            for listener in self.command_listeners:
+                listener(t, index, text)
 
-        i = 0
+    def is_moving(self, index):
+        state = self.state
+        return bool(state.turn[index] or state.travel[index].any() or index in self._paths)
 
+    def wait_motion(self, index, duration=0.0):
+        """Block until drone `index` has finished its current motion, which
+        is expected to take `duration` seconds."""
+        self.clock.sleep(duration)
+        if self.clock.event_driven:
+            # sleeping is what moves an event-driven clock, and the physics with it
+            while self.is_moving(index):
+                self.clock.sleep(self.dt)
+            return
+        with self.stepped:
+            self.stepped.wait_for(lambda: not self.is_moving(index) or not self.running)
+
+    async def wait_motion_async(self, index, duration=0.0):
+        """Coroutine version of `wait_motion`."""
+        await self.clock.sleep_async(duration)
+        while self.is_moving(index):
+            await self.clock.sleep_async(self.dt)
+
+    def advance_to(self, t):
+        """Run as many fixed physics steps as fit before simulated time `t`."""
+        with self.lock:
+            profiler = self.profiler
+            while self.physics_time + self.dt <= t:
+                # read once, the profiler can be switched on or off meanwhile
+                timing = profiler.enabled
+                if timing:
+                    start = time.perf_counter()
+                self.step(self.dt, self.wind)
+                self._ticks += 1
+                if self._paths:
+                    self._next_motions()
+                if self._landing:
+                    self._touch_down()
+                if timing:
+                    mark = time.perf_counter()
+                    profiler.add("physics.step", mark - start)
+                if self.collisions.enabled:
+                    self.collisions.check(self.state, self.physics_time)
+                    if timing:
+                        profiler.add("physics.collisions", time.perf_counter() - mark)
+                for recorder in self.recorders:
+                    recorder.record(self.state, self.physics_time)
+                # sampled per step, so long jumps of a fast clock keep every sample
+                if self.physics_time >= self._next_record:
+                    self._record_paths()
+
+            now = self.physics_time
+            if self.publish_snapshots and now != self.snapshot.t:
+                self.snapshot = Snapshot(self.state, now)
+
+            rate = self.telemetry.rate
+            if rate and now >= self._next_telemetry:
+                self._next_telemetry = now + 1 / rate
+                self.telemetry.publish(self.state, now)
+
+        # outside the lock, so callbacks can change the drones they hear about
+        self.collisions.dispatch()
+
+    def _record_paths(self):
+        now = self.physics_time
+        pos = self.state.pos
+        # come back when the recorder with the highest rate wants its next
+        # sample; each recorder skips samples that come too soon for its own
+        # rate, and a rate of 0 records every step
+        interval = np.inf
+        for i, tello in enumerate(self.tellos):
+            recorder = tello.flightPathTaken
+            recorder.record(now, pos[i])
+            rate = recorder.rate
+            interval = min(interval, 1 / rate if rate > 0 else 0)
+        self._next_record = now + (interval if np.isfinite(interval) else 0)
+
+    def update_physics(self):
         while self.running:
-            noise_x = uniform(-windAmt, windAmt) + noise_x / 2
-            noise_y = uniform(-windAmt, windAmt) + noise_y / 2
-            noise_z = uniform(-windAmt, windAmt) + noise_z / 2
-            noise_t = uniform(-windAmt, windAmt) + noise_t / 2
-
-            self.screen.fill((0, 0, 0))
-            if GRID:
-                for x in range(0, self.width, GRID):
-                    for y in range(0, self.height, GRID):
-                        pygame.draw.rect(self.screen, (100, 100, 100), pygame.Rect(x, y, GRID, GRID), 1)
-
-            for t in self.tellos:
-                if t.is_flying and t.is_windy:
-                        t.drone["pos"][0] += noise_x
-                        t.drone["pos"][1] += noise_y
-                        t.drone["pos"][2] += noise_z * 0.01
-                        t.drone["rot"] += noise_t * 0.03
-
-                        if t.drone["pos"][2] < 1:
-                            t.drone["pos"][2] = 1
-
-                t.flightPathTaken.append(tuple(t.drone["pos"]))
-
-                if SHOW_TRAILS:
-                    for path in t.flightPathTaken:
-                        pygame.draw.rect(self.screen, (200, 200, 200), pygame.Rect(path[0], path[1], 2, 2))
-
-                scaled_sprite = pygame.transform.scale(
-                    self.image,
-                    (
-                        int(
-                            t.drone["pos"][2]
-                            * self.image.get_width()
-                            * t.drone["scl"]
-                        ),
-                        int(
-                            t.drone["pos"][2]
-                            * self.image.get_height()
-                            * t.drone["scl"]
-                        ),
-                    ),
-                )
-                if t.drone['flip'] > 0:
-                    scaled_sprite = pygame.transform.scale(
-                        scaled_sprite, (int(scaled_sprite.get_width()*abs(t.drone['flip'] - 12)/12), scaled_sprite.get_height())
-                    )
-                    t.drone['flip'] -= 1
-                
-                rotated_sprite = pygame.transform.rotate(
-                    scaled_sprite, t.drone["rot"]
-                )
-                self.screen.blit(
-                    rotated_sprite,
-                    (
-                        t.drone["pos"][0] - rotated_sprite.get_width() / 2,
-                        t.drone["pos"][1] - rotated_sprite.get_height() / 2,
-                    ),
-                )
-                pygame.draw.circle(self.screen, t.drone["led"], (
-                        t.drone["pos"][0],
-                        t.drone["pos"][1]
-                    ), 10, 5)
+            clock = self.clock
+            # event-driven clocks step the physics from advance_to themselves
+            if clock.event_driven:
+                self.profiler.tick(time.perf_counter())
+                time.sleep(self.dt)
+                continue
 
-            pygame.display.flip()
-            pygame.time.delay(1000 // 60)
+            # a clock the physics cannot keep up with is held back with it, so
+            # scripts, cues and logs stay in step with the drones
+            clock.hold(self.physics_time + MAX_CATCHUP_STEPS * self.dt)
+            self.advance_to(clock.now())
+            with self.stepped:
+                self.stepped.notify_all()
+
+            profiler = self.profiler
+            profiler.tick(time.perf_counter())
+
+            # wake up in time for the next step, but not more than once a millisecond
+            wait = (self.physics_time + self.dt - clock.now()) / clock.scale
+            wait = min(max(wait, 0.001), self.dt)
+            if profiler.enabled:
+                # sleeping much longer than asked means the GIL or the OS kept us waiting
+                start = time.perf_counter()
+                time.sleep(wait)
+                profiler.add("physics.oversleep", time.perf_counter() - start - wait)
+            else:
+                time.sleep(wait)
+
+        # let the clock run on for scripts still sleeping on it
+        self.clock.hold(float("inf"))
+        with self.stepped:
+            self.stepped.notify_all()
+
+    def step(self, dt, windAmt=WIND):
+        """Advance every drone by one physics step of `dt` seconds."""
+        state = self.state
+        n = state.count
+        pos = state.pos[:n]
+        rot = state.rot[:n]
+        state.last_pos[:n] = pos
+        state.last_rot[:n] = rot
 
-                
+        # cover the outstanding motion at its set rate, never overshooting
+        travel = state.travel[:n]
+        moved = state.vel[:n] * dt
+        np.copyto(moved, travel, where=np.abs(moved) >= np.abs(travel))
+        pos += moved
+        travel -= moved
 
+        turn = state.turn[:n]
+        turned = state.spin[:n] * dt
+        np.copyto(turned, turn, where=np.abs(turned) >= np.abs(turn))
+        rot += turned
+        turn -= turned
 
-                    
\ No newline at end of file
+        # rc sticks, full stick flying as fast as a move at the drone's speed
+        rc = state.rc[:n]
+        if rc.any():
+            sticks = rc * (state.flying[:n] * state.speed[:n] * dt / 60)[:, None]
+            lr, fb, ud, yaw = sticks.T
+            heading = np.radians(rot)
+            sin_h, cos_h = np.sin(heading), np.cos(heading)
+            pos[:, 0] += fb * sin_h + lr * cos_h
+            pos[:, 1] += fb * cos_h - lr * sin_h
+            pos[:, 2] += ud / 100
+            rot -= yaw
+            np.maximum(pos[:, 2], 1, out=pos[:, 2])
+
+        # wind is smoothed noise, given in pixels per 60 Hz frame
+        uniform = self.random.uniform
+        self._wind = np.array([uniform(-windAmt, windAmt) for _ in range(4)]) + self._wind / 2
+        wind_x, wind_y, wind_z, wind_t = self._wind * dt * 60
+        windy = state.flying[:n] & state.windy[:n]
+        pos[windy] += (wind_x, wind_y, wind_z * 0.01)
+        rot[windy] += wind_t * 0.03
+        pos[windy & (pos[:, 2] < 1), 2] = 1
+
+        np.maximum(state.flip[:n] - dt * 60, 0, out=state.flip[:n])
+        state.flight_time[:n][state.flying[:n]] += dt
+
+    def update_visual(self):
+        frames = self.frames
+        while self.running:
+            # sleeps rather than spinning like pygame.time.delay, which holds
+            # the GIL and starves the physics thread
+            frames.wait()
+            # first, so a window uncovered while idle is repainted
+            self.event_loop()
+            snapshot = self.snapshot
+            if self._unchanged(snapshot):
+                frames.skip()
+                continue
+            start = time.perf_counter()
+            self.draw(snapshot)
+            frames.drawn(time.perf_counter() - start)
+            if self.profiler.enabled:
+                self.profiler.gauge("frame.fps", frames.stats()["measured_fps"])
+
+        _close_window()
+
+    def _unchanged(self, snapshot):
+        # True if drawing `snapshot` would show just what the last frame did
+        last = self._drawn_snapshot
+        if (last is None or self.renderer.full or self.profiler.overlay
+                or (self.show_trails and self.trails.fade)
+                or self._drawn_settings != self._settings()):
+            return False
+        return (snapshot.still() and not self.matrix.animated(snapshot.mled)
+                and (snapshot is last or snapshot.same(last)))
+
+    def _settings(self):
+        return self.grid, self.scenery, self.show_trails and self.frames.trails
+
+    def draw(self, snapshot=None):
+        # one snapshot for the whole frame, so it never mixes two physics steps
+        if snapshot is None:
+            snapshot = self.snapshot
+        self._drawn_snapshot = snapshot
+        self._drawn_settings = self._settings()
+        n = snapshot.count
+        now = self.clock.now()
+        pos, rot = snapshot.interpolate(now, self.dt)
+
+        profiler = self.profiler
+        start = time.perf_counter()
+        patterns = None
+        if snapshot.mled.any():
+            patterns = self.matrix.patterns(snapshot.mled, now - snapshot.mled_start)
+        rects = self.renderer.draw(
+            pos, rot, snapshot.flip, snapshot.scl, snapshot.led,
+            trails=self.trails if self.show_trails and self.frames.trails else None,
+            owners=self.tellos[:n], now=now, grid=self.grid, scenery=self.scenery, matrix=self.matrix, patterns=patterns,
+            restore=self._overlay, profiler=profiler,
+        )
+        self._overlay = []
+        if profiler.overlay:
+            self._overlay = profiler.draw(self.screen, pygame)
+            if rects is not None:
+                rects += self._overlay
+
+        mark = time.perf_counter()
+        # push only what changed, or everything after a full redraw
+        if rects is None:
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
+        if profiler.enabled:
+            end = time.perf_counter()
+            profiler.add("frame.flip", end - mark)
+            profiler.add("frame.total", end - start)
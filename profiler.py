@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+# set TELLO_SIM_PROFILE=1 to profile every simulation from the start
+PROFILE = os.environ.get("TELLO_SIM_PROFILE", "") not in ("", "0")
+# recent samples kept per metric for the percentiles
+PROFILE_WINDOW = 600
+
+LOGGER = logging.getLogger("djitellopy simulator")
+
+_DISABLED = nullcontext()
+
+
+class Profiler:
+    """Collects timings and gauges from the simulator's hot paths.
+
+    Timings are kept in seconds under dotted names: `frame.*` for each part of
+    drawing a frame, `physics.*` for the physics thread, `command.*` for the
+    latency and motion of Tello commands and `swarm.*` for `TelloSwarm`
+    dispatch and barrier waits. Gauges such as `swarm.queue_depth` are plain
+    values. Read them with `stats()`, draw them over the simulation with
+    `overlay`, or have them logged every `dump_every` seconds.
+
+    While `enabled` is False nothing is measured; the instrumented code only
+    checks the flag.
+
+    ```python
+    simulation.profiler.enabled = True
+    simulation.profiler.overlay = True
+    ...
+    print(simulation.profiler.stats()["frame.blit"])
+    ```
+    """
+
+    def __init__(self, enabled=PROFILE, window=PROFILE_WINDOW, dump_every=0, dump_path=None):
+        self.enabled = enabled
+        self.window = window
+        # draw the busiest timings in the corner of the simulation window
+        self.overlay = False
+        # log stats() this often in seconds, appending JSON lines to `dump_path` if given
+        self.dump_every = dump_every
+        self.dump_path = dump_path
+        self._next_dump = None
+        self._font = None
+        self.reset()
+
+    def reset(self):
+        self._timings = {}
+        self._gauges = {}
+
+    def _series(self, table, name):
+        series = table.get(name)
+        if series is None:
+            series = table[name] = [0, 0.0, deque(maxlen=self.window)]
+        return series
+
+    def add(self, name, seconds):
+        """Record that `name` took `seconds`."""
+        series = self._series(self._timings, name)
+        series[0] += 1
+        series[1] += seconds
+        series[2].append(seconds)
+
+    def gauge(self, name, value):
+        """Record the current value of `name`."""
+        series = self._series(self._gauges, name)
+        series[0] += 1
+        series[1] += value
+        series[2].append(value)
+
+    def timed(self, name):
+        """Context manager timing its body as `name`, or doing nothing while
+        the profiler is disabled."""
+        if not self.enabled:
+            return _DISABLED
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    @staticmethod
+    def _summary(series, scale):
+        count, total, recent = series
+        values = np.fromiter(recent, float, len(recent)) * scale
+        p50, p95 = np.percentile(values, (50, 95)) if len(values) else (0.0, 0.0)
+        return {
+            "count": count,
+            "mean": total * scale / count if count else 0.0,
+            "p50": float(p50),
+            "p95": float(p95),
+            "max": float(values.max()) if len(values) else 0.0,
+            "last": float(values[-1]) if len(values) else 0.0,
+        }
+
+    def stats(self):
+        """Every metric's count and all-time mean, and the median, 95th
+        percentile, max and last of its recent samples. Timings are in ms."""
+        stats = {name: self._summary(series, 1000) for name, series in list(self._timings.items())}
+        stats.update({name: self._summary(series, 1) for name, series in list(self._gauges.items())})
+        return stats
+
+    def tick(self, now):
+        """Dump the stats if `dump_every` seconds have passed since the last
+        dump. Called by the physics thread."""
+        if not self.dump_every:
+            return
+        if self._next_dump is None:
+            self._next_dump = now + self.dump_every
+        if now < self._next_dump:
+            return
+        self._next_dump = now + self.dump_every
+        self.dump()
+
+    def dump(self):
+        """Log the current stats, or append them to `dump_path` as a JSON line."""
+        stats = self.stats()
+        if self.dump_path is None:
+            for name, summary in sorted(stats.items()):
+                LOGGER.info("%s: mean %.3f, p95 %.3f, max %.3f (%d)",
+                            name, summary["mean"], summary["p95"], summary["max"], summary["count"])
+            return
+        with open(self.dump_path, "a") as fd:
+            fd.write(json.dumps({"time": time.time(), "stats": stats}) + "\n")
+
+    def draw(self, screen, pygame, lines=12):
+        """Draw the timings with the highest recent 95th percentile onto `screen`
+        and return the areas drawn."""
+        if self._font is None:
+            pygame.font.init()
+            self._font = pygame.font.SysFont("monospace", 14)
+            self._rows = []
+            self._next_rows = 0
+        # the percentiles only need working out a few times a second
+        now = time.perf_counter()
+        if now >= self._next_rows:
+            self._next_rows = now + 0.5
+            self._rows = [self._font.render(row, True, (255, 255, 0), (0, 0, 0))
+                          for row in self._overlay_rows(lines)]
+        return [screen.blit(text, (8, 8 + i * 18)) for i, text in enumerate(self._rows)]
+
+    def _overlay_rows(self, lines):
+        stats = self.stats()
+        timings = sorted(
+            (name for name in stats if name in self._timings),
+            key=lambda name: -stats[name]["p95"],
+        )[:lines]
+        rows = ["{:<22} p50 {:7.2f}  p95 {:7.2f} ms".format(name, stats[name]["p50"], stats[name]["p95"])
+                for name in timings]
+        rows += ["{:<22} {:g}".format(name, stats[name]["last"]) for name in stats if name in self._gauges]
+        return rows
@@ -0,0 +1,308 @@
+import time
+
+import numpy as np
+
+from flightRecorder import FlightRecorder
+from physicsSim import sim
+
+# frames per second kept by a session recorder
+SESSION_RECORD_RATE = 30
+# where drones that have not been created yet wait during a replay
+OFFSCREEN = (-10000.0, -10000.0, 1.0)
+
+
+class SessionLog:
+    """A recorded session, stored column by column.
+
+    Frame `f` of drone `i` is `pos[f, i]`, `rot[f, i]`, `led[f, i]` and
+    `flip[f, i]` at time `t[f]`; drones created part way through have NaN
+    positions before then. Its matrix LED shows `mled_shows[mled[f, i]]`,
+    set at `mled_start[f, i]`. The commands the drones were sent are
+    `cmd_text[k]`, sent to drone `cmd_drone[k]` at `cmd_t[k]`.
+    """
+
+    ARRAYS = ("t", "pos", "rot", "led", "flip", "scl", "cmd_t", "cmd_drone", "cmd_text",
+              "mled", "mled_start", "mled_shows")
+
+    def __init__(self, t, pos, rot, led, flip, scl, cmd_t, cmd_drone, cmd_text,
+                 mled=None, mled_start=None, mled_shows=None):
+        self.t = t
+        self.pos = pos
+        self.rot = rot
+        self.led = led
+        self.flip = flip
+        self.scl = scl
+        self.cmd_t = cmd_t
+        self.cmd_drone = cmd_drone
+        self.cmd_text = cmd_text
+        # logs recorded before the matrix LED was kept show a blank matrix
+        self.mled = np.zeros(rot.shape, dtype=np.int32) if mled is None else mled
+        self.mled_start = np.zeros(rot.shape) if mled_start is None else mled_start
+        self.mled_shows = np.array([""]) if mled_shows is None else mled_shows
+
+    @staticmethod
+    def load(path):
+        """Read a log written by `save`."""
+        with np.load(path) as data:
+            return SessionLog(**{name: data[name] for name in SessionLog.ARRAYS if name in data.files})
+
+    def save(self, path, compress=False):
+        """Write the log to `path` as a NumPy `.npz` archive."""
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        if compress:
+            np.savez_compressed(path, **arrays)
+        else:
+            np.savez(path, **arrays)
+
+    @property
+    def drones(self):
+        return self.pos.shape[1]
+
+    @property
+    def duration(self):
+        return float(self.t[-1] - self.t[0]) if len(self.t) else 0.0
+
+    def frame_at(self, t):
+        """Index of the last frame at or before time `t`."""
+        return int(min(max(np.searchsorted(self.t, t, "right") - 1, 0), len(self.t) - 1))
+
+    def state_at(self, t):
+        """`(pos, rot, flip, led)` of every drone at time `t`, interpolated
+        between the frames either side of it."""
+        f = self.frame_at(t)
+        g = min(f + 1, len(self.t) - 1)
+        span = self.t[g] - self.t[f]
+        alpha = min(max((t - self.t[f]) / span, 0.0), 1.0) if span > 0 else 0.0
+        pos = self.pos[f] + (self.pos[g] - self.pos[f]) * alpha
+        rot = self.rot[f] + (self.rot[g] - self.rot[f]) * alpha
+        flip = self.flip[f] + (self.flip[g] - self.flip[f]) * alpha
+        return pos, rot, flip, self.led[f]
+
+    def mled_at(self, t):
+        """`(show, seconds)` of every drone's matrix LED at time `t`: the
+        index into `mled_shows` and how long it has been shown."""
+        f = self.frame_at(t)
+        return self.mled[f], t - self.mled_start[f]
+
+    def matrix_ids(self, matrix):
+        """The id `matrix`, a `MatrixDisplay`, gives each of `mled_shows`."""
+        return np.array([(matrix.show(command) or 0) if command else 0
+                         for command in self.mled_shows.tolist()], dtype=np.int32)
+
+    def commands(self, start=-np.inf, end=np.inf):
+        """`(t, drone, command)` for each command sent with `start <= t < end`."""
+        lo, hi = np.searchsorted(self.cmd_t, (start, end))
+        return list(zip(
+            self.cmd_t[lo:hi].tolist(),
+            self.cmd_drone[lo:hi].tolist(),
+            self.cmd_text[lo:hi].tolist(),
+        ))
+
+    def __len__(self):
+        return len(self.t)
+
+
+class SessionRecorder:
+    """Records every drone in a simulation, and every command they are sent,
+    into growable NumPy arrays for a [SessionLog][sessionlog].
+
+    ```python
+    recorder = SessionRecorder(swarm.simulation).start()
+    ...
+    recorder.save('show.npz')
+    ```
+    """
+
+    def __init__(self, simulation, rate=SESSION_RECORD_RATE, capacity=1024):
+        self.simulation = simulation
+        self.rate = rate
+        self._frames = 0
+        self._drones = 0
+        self._last = -np.inf
+        self._allocate(capacity, max(simulation.state.count, 1))
+        self._commands = []
+
+    def _allocate(self, frames, drones):
+        # (re)size the columns, keeping what has been recorded so far
+        old = getattr(self, "_t", None)
+        t = np.empty(frames)
+        pos = np.full((frames, drones, 3), np.nan, dtype=np.float32)
+        rot = np.zeros((frames, drones), dtype=np.float32)
+        led = np.zeros((frames, drones, 3), dtype=np.uint8)
+        flip = np.zeros((frames, drones), dtype=np.float32)
+        mled = np.zeros((frames, drones), dtype=np.int32)
+        mled_start = np.zeros((frames, drones))
+        if old is not None:
+            f, n = self._frames, self._drones
+            t[:f] = self._t[:f]
+            pos[:f, :n] = self._pos[:f, :n]
+            rot[:f, :n] = self._rot[:f, :n]
+            led[:f, :n] = self._led[:f, :n]
+            flip[:f, :n] = self._flip[:f, :n]
+            mled[:f, :n] = self._mled[:f, :n]
+            mled_start[:f, :n] = self._mled_start[:f, :n]
+        self._t, self._pos, self._rot, self._led, self._flip = t, pos, rot, led, flip
+        self._mled, self._mled_start = mled, mled_start
+
+    def start(self):
+        self.simulation.recorders.append(self)
+        self.simulation.command_listeners.append(self.command)
+        return self
+
+    def stop(self):
+        if self in self.simulation.recorders:
+            self.simulation.recorders.remove(self)
+        if self.command in self.simulation.command_listeners:
+            self.simulation.command_listeners.remove(self.command)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def record(self, state, t):
+        """Store a frame of `state` at time `t` unless the last is too recent."""
+        if self.rate and t - self._last < 1 / self.rate - 1e-9:
+            return False
+        self._last = t
+
+        n = state.count
+        frames, drones = self._pos.shape[:2]
+        if self._frames == frames or n > drones:
+            self._allocate(frames * 2 if self._frames == frames else frames, max(n, drones))
+        self._drones = max(self._drones, n)
+
+        f = self._frames
+        self._t[f] = t
+        self._pos[f, :n] = state.pos[:n]
+        self._rot[f, :n] = state.rot[:n]
+        self._led[f, :n] = state.led[:n]
+        self._flip[f, :n] = state.flip[:n]
+        self._mled[f, :n] = state.mled[:n]
+        self._mled_start[f, :n] = state.mled_start[:n]
+        self._frames += 1
+        return True
+
+    def command(self, t, index, text):
+        self._commands.append((t, index, text))
+
+    def log(self):
+        """Copy of everything recorded so far."""
+        f, n = self._frames, self._drones
+        commands = sorted(self._commands, key=lambda command: command[0])
+        return SessionLog(
+            t=self._t[:f].copy(),
+            pos=self._pos[:f, :n].copy(),
+            rot=self._rot[:f, :n].copy(),
+            led=self._led[:f, :n].copy(),
+            flip=self._flip[:f, :n].copy(),
+            scl=self.simulation.state.scl[:n].copy(),
+            cmd_t=np.array([c[0] for c in commands], dtype=float),
+            cmd_drone=np.array([c[1] for c in commands], dtype=np.int32),
+            cmd_text=np.array([c[2] for c in commands], dtype=str),
+            mled=self._mled[:f, :n].copy(),
+            mled_start=self._mled_start[:f, :n].copy(),
+            mled_shows=np.array(self.simulation.matrix.commands(), dtype=str),
+        )
+
+    def save(self, path, compress=False):
+        self.log().save(path, compress)
+
+
+class _ReplayDrone:
+    # stands in for a Tello, so the simulation has something to draw
+
+    def __init__(self):
+        self.flightPathTaken = FlightRecorder()
+        self.trail_colour = None
+
+
+class SessionReplay:
+    """Plays a [SessionLog][sessionlog] back through a simulation's renderer,
+    at any speed or a frame at a time. No physics, wind or latency is
+    involved, so every replay looks exactly like the recording.
+
+    ```python
+    replay = SessionReplay(SessionLog.load('show.npz'))
+    replay.play(speed=10)
+    replay.seek(30)
+    replay.step()
+    ```
+    """
+
+    def __init__(self, log, simulation=None, headless=None):
+        if not len(log):
+            raise ValueError("The session log has no frames")
+        self.log = log
+        self.simulation = simulation or sim(clock="realtime", headless=headless)
+        # functions called with (t, drone, command) as playback passes each command
+        self.callbacks = []
+
+        self.first = self.simulation.state.count
+        for i in range(log.drones):
+            index = self.simulation.register(_ReplayDrone())
+            self.simulation.state.scl[index] = log.scl[i]
+        # recorded matrix shows, as the ids this simulation knows them by
+        self._shows = log.matrix_ids(self.simulation.matrix)
+        self.frame = 0
+        self.apply(0)
+
+    @property
+    def t(self):
+        """Recorded time of the frame on display."""
+        return float(self.log.t[self.frame])
+
+    def apply(self, frame):
+        """Show frame `frame` of the log."""
+        log = self.log
+        pos = np.where(np.isnan(log.pos[frame]), OFFSCREEN, log.pos[frame])
+        drones = slice(self.first, self.first + log.drones)
+        with self.simulation.lock:
+            state = self.simulation.state
+            state.pos[drones] = pos
+            state.last_pos[drones] = pos
+            state.rot[drones] = log.rot[frame]
+            state.last_rot[drones] = log.rot[frame]
+            state.led[drones] = log.led[frame]
+            state.flip[drones] = log.flip[frame]
+            # scrolling patterns carry on from where the recording was
+            state.mled[drones] = self._shows[log.mled[frame]]
+            state.mled_start[drones] = self.simulation.clock.now() - (log.t[frame] - log.mled_start[frame])
+        if self.simulation.publish_snapshots:
+            # show it at once, even while playback is paused
+            self.simulation.take_snapshot()
+        self.frame = frame
+
+    def _advance(self, frame):
+        # move to `frame`, telling the callbacks about the commands passed
+        if self.callbacks and frame > self.frame:
+            # the first and last frames also cover commands sent before or after them
+            start = self.t if self.frame else -np.inf
+            end = float(self.log.t[frame]) if frame < len(self.log) - 1 else np.inf
+            for command in self.log.commands(start, end):
+                for callback in self.callbacks:
+                    callback(*command)
+        self.apply(frame)
+
+    def seek(self, t):
+        """Jump to the frame showing time `t`."""
+        self.apply(self.log.frame_at(t))
+
+    def step(self, frames=1):
+        """Move `frames` frames forwards, or backwards if negative."""
+        self._advance(min(max(self.frame + frames, 0), len(self.log) - 1))
+        return self.t
+
+    def play(self, speed=1.0, end=None):
+        """Play from the current frame at `speed` times real time until `end`
+        or the end of the log."""
+        end = self.log.t[-1] if end is None else end
+        start = self.t
+        origin = time.perf_counter()
+        while self.simulation.running:
+            t = start + (time.perf_counter() - origin) * speed
+            self._advance(self.log.frame_at(min(t, end)))
+            if t >= end:
+                break
+            time.sleep(1 / 60)
@@ -0,0 +1,162 @@
+"""The Tello SDK's text commands, parsed through one precompiled table that
+`Tello.send_command_with_return`, `Tello.send_command_without_return` and
+the UDP server all share.
+
+Each entry converts and range checks the command's arguments, carries it out
+with the Tello method of the same meaning (`forward 50` calls
+`tello.move("forward", 50)`) and, for motions, can plan the motion without
+flying it, so callers that must not block can hand it to the physics thread.
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+# distinct command strings kept parsed; control loops resend the same few
+PARSE_CACHE_SIZE = 4096
+
+# `call(tello, *args)` carries the command out and returns its response, None
+# for "ok". `plan(tello, *args)` returns the list of `(offset, turn, steps)`
+# motions a motion command flies, and is None for every other command.
+SdkCommand = namedtuple("SdkCommand", "name args call plan")
+
+# stands for the whole command text, for commands that parse it themselves
+TEXT = object()
+
+
+def _ranged(low, high, convert=int):
+    def parse(word):
+        value = convert(word)
+        if not low <= value <= high:
+            raise ValueError("out of range: {} is not {}-{}".format(word, low, high))
+        return value
+    return parse
+
+
+def _choice(*choices):
+    def parse(word):
+        if word not in choices:
+            raise ValueError("{} is not one of {}".format(word, "/".join(choices)))
+        return word
+    return parse
+
+
+def _flying(tello):
+    if not tello.is_flying:
+        # the same message the Tello methods raise TelloException with
+        raise ValueError("Drone is not flying!")
+
+
+def _move(direction):
+    def plan(tello, x):
+        _flying(tello)
+        return [tello._move_motion(direction, x)]
+    return SdkCommand(direction, (_ranged(20, 500),), lambda tello, x: tello.move(direction, x), plan)
+
+
+def _rotate(direction):
+    def plan(tello, x):
+        _flying(tello)
+        return [tello._rotate_motion(direction, x)]
+    return SdkCommand(direction, (_ranged(1, 360),), lambda tello, x: tello.rotate(direction, x), plan)
+
+
+def _go_plan(tello, *args):
+    _flying(tello)
+    return [tello._go_motion(*args)]
+
+
+def _curve_plan(tello, *args):
+    _flying(tello)
+    return tello._curve_motions(*args)
+
+
+def _stop(tello):
+    tello._command("stop")
+    tello.simulation.set_motion(tello.index)
+    tello.simulation.set_rc(tello.index)
+
+
+def _ok(tello, *args):
+    return None
+
+
+COORDINATE = _ranged(-500, 500)
+
+COMMANDS = {
+    "command": SdkCommand("command", (), _ok, None),
+    "takeoff": SdkCommand(
+        "takeoff", (), lambda tello: tello.takeoff(), lambda tello: [tello._height_motion(1.5)]
+    ),
+    "land": SdkCommand(
+        "land", (), lambda tello: tello.land(), lambda tello: [tello._height_motion(1.0)]
+    ),
+    "forward": _move("forward"),
+    "back": _move("back"),
+    "left": _move("left"),
+    "right": _move("right"),
+    "up": _move("up"),
+    "down": _move("down"),
+    "cw": _rotate("cw"),
+    "ccw": _rotate("ccw"),
+    "go": SdkCommand(
+        "go", (COORDINATE,) * 3 + (_ranged(10, 100),),
+        lambda tello, *args: tello.go_xyz_speed(*args), _go_plan,
+    ),
+    "curve": SdkCommand(
+        "curve", (COORDINATE,) * 6 + (_ranged(10, 60),),
+        lambda tello, *args: tello.curve_xyz_speed(*args), _curve_plan,
+    ),
+    "flip": SdkCommand("flip", (_choice("l", "r", "f", "b"),), lambda tello, d: tello.flip(d), None),
+    "speed": SdkCommand("speed", (_ranged(10, 100),), lambda tello, x: tello.set_speed(x), None),
+    "rc": SdkCommand(
+        "rc", (_ranged(-100, 100),) * 4, lambda tello, *args: tello.send_rc_control(*args), None
+    ),
+    "stop": SdkCommand("stop", (), _stop, None),
+    "emergency": SdkCommand("emergency", (), lambda tello: tello.emergency(), None),
+    "EXT": SdkCommand("EXT", TEXT, lambda tello, text: tello._ext(text), None),
+    # nothing to simulate for the camera, motors, wifi or mission pads
+    "streamon": SdkCommand("streamon", (), _ok, None),
+    "streamoff": SdkCommand("streamoff", (), _ok, None),
+    "motoron": SdkCommand("motoron", (), _ok, None),
+    "motoroff": SdkCommand("motoroff", (), _ok, None),
+    "mon": SdkCommand("mon", (), _ok, None),
+    "moff": SdkCommand("moff", (), _ok, None),
+    "mdirection": SdkCommand("mdirection", (_ranged(0, 2),), _ok, None),
+    "wifi": SdkCommand("wifi", TEXT, _ok, None),
+    "ap": SdkCommand("ap", TEXT, _ok, None),
+}
+
+# read commands, answered from the drone's state
+QUERIES = {
+    "speed?": lambda tello: str(int(tello.drone["speed"] / 4)),
+    "battery?": lambda tello: str(tello.get_battery()),
+    "time?": lambda tello: "{}s".format(tello.get_flight_time()),
+    "height?": lambda tello: "{}dm".format(tello.get_height() // 10),
+    "temp?": lambda tello: "{}~{}C".format(tello.get_lowest_temperature(), tello.get_highest_temperature()),
+    "attitude?": lambda tello: "pitch:{};roll:{};yaw:{};".format(
+        tello.get_pitch(), tello.get_roll(), tello.get_yaw()),
+    "baro?": lambda tello: str(tello.get_barometer() / 100),
+    "acceleration?": lambda tello: "agx:{:.2f};agy:{:.2f};agz:{:.2f};".format(
+        tello.get_acceleration_x(), tello.get_acceleration_y(), tello.get_acceleration_z()),
+    "tof?": lambda tello: "{}mm".format(tello.get_distance_tof() * 10),
+    "wifi?": lambda tello: "90",
+    "sdk?": lambda tello: "30",
+    "sn?": lambda tello: "0TQSIM{:06d}".format(tello.index),
+}
+COMMANDS.update({name: SdkCommand(name, (), response, None) for name, response in QUERIES.items()})
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse(text):
+    """`(SdkCommand, args)` for the command `text`, with its arguments
+    converted. Raises ValueError for unknown commands and bad arguments."""
+    words = text.split()
+    if not words:
+        raise ValueError("empty command")
+    command = COMMANDS.get(words[0])
+    if command is None:
+        raise ValueError("unknown command: {}".format(words[0]))
+    if command.args is TEXT:
+        return command, (text.strip(),)
+    if len(words) - 1 != len(command.args):
+        raise ValueError("{} takes {} arguments".format(words[0], len(command.args)))
+    return command, tuple(convert(word) for convert, word in zip(command.args, words[1:]))
@@ -0,0 +1,227 @@
+import socket
+import selectors
+import threading
+import time
+import telloCommands
+from djitellopySim import Tello, TelloSwarm, TelloException
+
+
+def loopback_host(ip):
+    """Loopback address standing in for a drone's real IP: 192.168.10.5
+    becomes 127.168.10.5, so clients only swap the first octet."""
+    return ".".join(["127"] + ip.strip().split(".")[1:])
+
+
+class _Endpoint:
+    # one simulated drone's socket and the command it is working on
+
+    def __init__(self, tello, sock):
+        self.tello = tello
+        self.sock = sock
+        self.client = None
+        self.command = None
+        self.args = ()
+        self.started = False
+        self.start_at = None
+
+
+class TelloServer:
+    """Serves simulated drones over the Tello SDK's UDP text protocol, so
+    code written against the real djitellopy can fly them unchanged.
+
+    Every drone gets a control socket bound to its loopback host on
+    `control_port`. Commands are answered with `ok`/`error` once they finish,
+    and state packets are streamed from the same socket to port `state_port`
+    of whoever last sent a command. A single selector serves every socket.
+
+    ```python
+    server = TelloServer.fromFile('ip.txt')
+    server.start()
+    ```
+    """
+
+    @staticmethod
+    def fromFile(path: str, simulation=None, **kwargs):
+        """Serve a new TelloSwarm created from a file of IP addresses."""
+        return TelloServer(TelloSwarm.fromFile(path, simulation).tellos, **kwargs)
+
+    @staticmethod
+    def fromIps(ips: list, simulation=None, **kwargs):
+        """Serve a new TelloSwarm created from a list of IP addresses."""
+        return TelloServer(TelloSwarm.fromIps(ips, simulation).tellos, **kwargs)
+
+    def __init__(self, tellos, hosts=None, control_port=Tello.CONTROL_UDP_PORT,
+                 state_port=Tello.STATE_UDP_PORT, state_rate=10):
+        """Arguments:
+            tellos: drones to serve
+            hosts: address to bind for each drone, by default the
+                `loopback_host` of its IP
+            control_port: port each drone listens for commands on
+            state_port: client port state packets are sent to
+            state_rate: state packets per second, per drone
+        """
+        if hosts is None:
+            hosts = [loopback_host(tello.address[0]) for tello in tellos]
+        if len(hosts) != len(tellos):
+            raise TelloException("Need one host per drone")
+
+        self.tellos = tellos
+        self.simulation = tellos[0].simulation
+        self.state_port = state_port
+        self.state_rate = state_rate
+        self.running = False
+        self.thread = None
+        self.selector = selectors.DefaultSelector()
+        self.endpoints = []
+
+        for tello, host in zip(tellos, hosts):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((host, control_port))
+            sock.setblocking(False)
+            endpoint = _Endpoint(tello, sock)
+            self.selector.register(sock, selectors.EVENT_READ, endpoint)
+            self.endpoints.append(endpoint)
+
+    @property
+    def addresses(self):
+        """The `(host, port)` each drone listens on, in drone order."""
+        return [endpoint.sock.getsockname() for endpoint in self.endpoints]
+
+    def start(self):
+        """Serve from a background thread."""
+        if self.simulation.clock.event_driven:
+            raise TelloException("The UDP server needs a real-time or scaled clock")
+        self.running = True
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        for endpoint in self.endpoints:
+            self.selector.unregister(endpoint.sock)
+            endpoint.sock.close()
+        self.endpoints = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def serve_forever(self):
+        self.running = True
+        interval = 1 / self.state_rate
+        next_state = time.perf_counter()
+
+        while self.running:
+            timeout = max(min(next_state - time.perf_counter(), 0.005), 0)
+            for key, _ in self.selector.select(timeout):
+                self._receive(key.data)
+
+            self._progress()
+
+            if time.perf_counter() >= next_state:
+                next_state += interval
+                self._send_state()
+
+    def _receive(self, endpoint):
+        while True:
+            try:
+                data, address = endpoint.sock.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                return
+            endpoint.client = address
+            try:
+                command = data.decode("utf-8").strip()
+            except UnicodeDecodeError:
+                self._reply(endpoint, "error")
+                continue
+            if command:
+                self._handle(endpoint, command)
+
+    def _reply(self, endpoint, response):
+        if endpoint.client is not None:
+            endpoint.sock.sendto(response.encode("utf-8"), endpoint.client)
+
+    def _handle(self, endpoint, command):
+        tello = endpoint.tello
+        try:
+            sdk_command, args = telloCommands.parse(command)
+        except ValueError as e:
+            if not command.startswith("rc"):
+                self._reply(endpoint, "error {}".format(e))
+            return
+
+        if sdk_command.name == "rc":
+            # rc commands are never answered, and fly even during a motion
+            sdk_command.call(tello, *args)
+            return
+        if endpoint.command is not None:
+            if sdk_command.name not in ("stop", "emergency"):
+                self._reply(endpoint, "error Not joystick")
+                return
+            # like the real drone, these cut the current command short; it
+            # gets no answer of its own
+            endpoint.command = None
+
+        try:
+            if sdk_command.plan is None:
+                response = sdk_command.call(tello, *args)
+                self._reply(endpoint, "ok" if response is None else response)
+                return
+            # check the motion can be flown before accepting it
+            sdk_command.plan(tello, *args)
+        except (TelloException, ValueError) as e:
+            self._reply(endpoint, "error {}".format(e))
+            return
+
+        # like the real drone, answer once the command has been carried out
+        self.simulation.command(tello.index, command)
+        endpoint.command = sdk_command
+        endpoint.args = args
+        endpoint.started = False
+        endpoint.start_at = self.simulation.clock.now() + tello._latency()
+
+    def _progress(self):
+        # start motions whose latency has passed and answer finished ones
+        now = self.simulation.clock.now()
+        for endpoint in self.endpoints:
+            sdk_command = endpoint.command
+            if sdk_command is None:
+                continue
+            tello = endpoint.tello
+            if not endpoint.started:
+                if now < endpoint.start_at:
+                    continue
+                endpoint.started = True
+                if sdk_command.name == "takeoff":
+                    tello.is_flying = True
+                elif sdk_command.name == "land":
+                    self.simulation.set_rc(tello.index)
+                try:
+                    # planned from where the drone is once the latency has passed
+                    tello._start_motions(sdk_command.plan(tello, *endpoint.args),
+                                         landing=sdk_command.name == "land")
+                except Exception as e:
+                    # one drone's bad command mustn't stop the server for all
+                    endpoint.command = None
+                    self._reply(endpoint, "error {}".format(e))
+            elif not self.simulation.is_moving(tello.index):
+                # a landing drone stopped flying when it touched down
+                endpoint.command = None
+                self._reply(endpoint, "ok")
+
+    def _send_state(self):
+        for endpoint in self.endpoints:
+            if endpoint.client is None:
+                continue
+            packet = endpoint.tello.get_state_packet().encode("utf-8")
+            try:
+                endpoint.sock.sendto(packet, (endpoint.client[0], self.state_port))
+            except OSError:
+                pass
+
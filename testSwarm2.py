@@ -1,5 +1,4 @@
-from time import sleep
-from djitellopySim import TelloSwarm
+from djitellopySim import TelloSwarm, sleep
 
 baseIP = "192.168.10." # do not modify
 
@@ -0,0 +1,178 @@
+import os
+import shutil
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import physicsSim
+from physicsSim import SpriteCache, TrailLayer, draw_swarm
+from matrixLed import MatrixDisplay
+from sessionLog import SessionLog, OFFSCREEN
+
+EXPORT_FPS = 60
+EXPORT_SIZE = (1000, 1000)
+
+
+def frame_times(log, fps=EXPORT_FPS, start=None, end=None):
+    """Time of every frame to export from `log`."""
+    start = log.t[0] if start is None else start
+    end = log.t[-1] if end is None else end
+    return np.arange(start, end + 1e-9, 1 / fps)
+
+
+def split(count, chunks):
+    """`(first, last)` frame ranges dividing `count` frames into `chunks`."""
+    bounds = np.linspace(0, count, chunks + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+class _Renderer:
+    # draws frames of a log off-screen, the same way the simulation window does
+
+    def __init__(self, log, size, trails, grid):
+        physicsSim._load_pygame()
+        pygame = physicsSim.pygame
+        self.log = log
+        self.screen = pygame.Surface(size)
+        self.sprites = SpriteCache(pygame.image.load(physicsSim.IMAGE_PATH))
+        self.trails = TrailLayer(size) if trails else None
+        self.grid = grid
+        self.matrix = MatrixDisplay()
+        self.shows = log.matrix_ids(self.matrix)
+
+    def state(self, t):
+        pos, rot, flip, led = self.log.state_at(t)
+        return np.where(np.isnan(pos), OFFSCREEN, pos), rot, flip, led
+
+    def warm_up(self, times):
+        # trails carry the whole show's history, so lay down the earlier part
+        if self.trails is None:
+            return
+        for t in times:
+            pos = self.state(t)[0].tolist()
+            for i, (x, y, _) in enumerate(pos):
+                self.trails.add(i, self.trails.colour(i, i), x, y, t)
+            self.trails.update(t)
+
+    def render(self, t):
+        pos, rot, flip, led = self.state(t)
+        shows, elapsed = self.log.mled_at(t)
+        patterns = self.matrix.patterns(self.shows[shows], elapsed) if shows.any() else None
+        draw_swarm(
+            self.screen, self.sprites, pos, rot, flip, self.log.scl, led,
+            trails=self.trails, now=t, grid=self.grid, matrix=self.matrix, patterns=patterns,
+        )
+        return self.screen
+
+
+def _render_chunk(job):
+    log, times, first, last, output, size, trails, grid, fps = job
+    if isinstance(log, str):
+        log = SessionLog.load(log)
+    renderer = _Renderer(log, size, trails, grid)
+    renderer.warm_up(times[:first])
+    pygame = physicsSim.pygame
+
+    if output.endswith(".mp4"):
+        encoder = subprocess.Popen(
+            [
+                "ffmpeg", "-loglevel", "error", "-y",
+                "-f", "rawvideo", "-pix_fmt", "rgb24",
+                "-s", "{}x{}".format(*size), "-r", str(fps), "-i", "-",
+                "-c:v", "libx264", "-pix_fmt", "yuv420p", output,
+            ],
+            stdin=subprocess.PIPE,
+        )
+        for t in times[first:last]:
+            # tostring rather than tobytes, which needs pygame 2.1.3
+            encoder.stdin.write(pygame.image.tostring(renderer.render(t), "RGB"))
+        encoder.stdin.close()
+        if encoder.wait():
+            raise RuntimeError("ffmpeg failed to encode {}".format(output))
+    else:
+        for frame in range(first, last):
+            pygame.image.save(renderer.render(times[frame]), output.format(frame))
+    return output
+
+
+def export(log, path, fps=EXPORT_FPS, start=None, end=None, workers=None,
+           size=EXPORT_SIZE, trails=None, grid=None):
+    """Render a recorded session to an MP4 video, or to a directory of PNG
+    frames if `path` does not end in `.mp4`.
+
+    The frames are split into one run per worker process, each rendered
+    off-screen and, for video, encoded into its own segment by `ffmpeg`
+    before the segments are joined in order.
+
+    Arguments:
+        log: [SessionLog][sessionlog], or the path of one
+        path: video file or frame directory to write
+        fps: frames per second to render
+        start, end: part of the session to render, in recorded seconds
+        workers: number of processes, one per CPU by default
+        trails, grid: as `SHOW_TRAILS` and `GRID`, which they default to
+
+    ```python
+    export('show.npz', 'show.mp4')
+    ```
+    """
+    loaded = SessionLog.load(log) if isinstance(log, str) else log
+    times = frame_times(loaded, fps, start, end)
+    workers = workers or os.cpu_count() or 1
+    trails = physicsSim.SHOW_TRAILS if trails is None else trails
+    grid = physicsSim.GRID if grid is None else grid
+    chunks = split(len(times), workers)
+    video = path.endswith(".mp4")
+
+    if video:
+        if shutil.which("ffmpeg") is None:
+            raise RuntimeError("Exporting video needs ffmpeg on the PATH")
+        scratch = tempfile.mkdtemp(prefix="tello-export-")
+        outputs = [os.path.join(scratch, "part{:04d}.mp4".format(k)) for k in range(len(chunks))]
+    else:
+        os.makedirs(path, exist_ok=True)
+        outputs = [os.path.join(path, "frame{:06d}.png")] * len(chunks)
+
+    jobs = [
+        (log, times, first, last, output, size, trails, grid, fps)
+        for (first, last), output in zip(chunks, outputs)
+    ]
+    if workers == 1:
+        list(map(_render_chunk, jobs))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            list(pool.map(_render_chunk, jobs))
+
+    if video:
+        playlist = os.path.join(scratch, "parts.txt")
+        with open(playlist, "w") as fd:
+            fd.writelines("file '{}'\n".format(output) for output in outputs)
+        subprocess.run(
+            ["ffmpeg", "-loglevel", "error", "-y", "-f", "concat", "-safe", "0",
+             "-i", playlist, "-c", "copy", path],
+            check=True,
+        )
+        shutil.rmtree(scratch)
+    return len(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a recorded session to video or PNG frames.")
+    parser.add_argument("log", help="session log written by SessionRecorder.save")
+    parser.add_argument("output", help="an .mp4 file, or a directory for PNG frames")
+    parser.add_argument("--fps", type=int, default=EXPORT_FPS)
+    parser.add_argument("--start", type=float)
+    parser.add_argument("--end", type=float)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--trails", action="store_true")
+    parser.add_argument("--grid", type=int, default=0)
+    args = parser.parse_args()
+
+    count = export(
+        args.log, args.output, fps=args.fps, start=args.start, end=args.end,
+        workers=args.workers, trails=args.trails, grid=args.grid,
+    )
+    print("Rendered {} frames to {}".format(count, args.output))